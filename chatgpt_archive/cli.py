@@ -2,7 +2,7 @@ import argparse
 from pathlib import Path
 from typing import Any
 
-from .importer import ImportOptions, import_archive
+from .importer import OUTPUT_FORMATS, ImportOptions, import_archive
 from .server import ArchiveServer
 from .utils import DEFAULT_SOURCE_ID
 
@@ -37,6 +37,13 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Append to existing archive without dropping previous imports (full rebuild by default)",
     )
+    import_cmd.add_argument(
+        "--formats",
+        nargs="+",
+        choices=OUTPUT_FORMATS,
+        default=["json"],
+        help="Files to write per conversation besides conversation.json (md, html, obsidian). Default: json only",
+    )
 
     serve_cmd = subparsers.add_parser("serve", help="Serve local UI from an existing archive")
     serve_cmd.add_argument("--root", type=Path, required=True, help="Archive root folder (with projects/ and index.db)")
@@ -53,6 +60,7 @@ def run_import(args: argparse.Namespace) -> None:
         allow_network_images=args.allow_network_images,
         incremental=args.incremental,
         source_id=args.source_id,
+        formats=set(args.formats) | {"json"},
     )
     stats: Any = import_archive(options)
     print(
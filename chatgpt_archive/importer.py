@@ -1,21 +1,28 @@
 import json
+import multiprocessing
+import os
 import re
 import shutil
 import sqlite3
 import tempfile
 import zipfile
-from dataclasses import dataclass
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 import html
 
 from .utils import (
     DEFAULT_SOURCE_ID,
+    batched,
     ensure_dir,
     generate_conversation_id,
     load_project_overrides,
+    loads_json,
     make_conversation_uid,
     make_project_uid,
+    normalize_project_name,
     normalize_source_id,
     safe_name,
     split_project_uid,
@@ -24,6 +31,146 @@ from .utils import (
     write_json,
 )
 
+# Дополнительные представления беседы рядом с conversation.json: формат -> (ключ в "files", имя файла)
+_FORMAT_FILES = {
+    "md": ("markdown", "conversation.md"),
+    "html": ("html", "conversation.html"),
+    "obsidian": ("obsidian", "conversation-obsidian.md"),
+}
+OUTPUT_FORMATS = ("json",) + tuple(_FORMAT_FILES)
+
+# Один проход по тексту вместо четырех:
+# - служебные маркеры ChatGPT, обрамленные символами U+E200 … U+E201 (private use area);
+# - остатки cite|finance маркеров в квадратных скобках;
+# - псевдо-ссылки формата 【turn6file4†L31-L39】.
+_INLINE_MARKERS = re.compile(r"\ue200[^\ue201]*\ue201|\[(?:cite|finance):[^\]]+\]|【[^】]*】")
+_ZIP_COPY_BUFFER = 1 << 20  # 1 MiB вместо маленького буфера extractall
+
+# FTS хранит только индекс, текст читается из messages (content_rowid = messages.id).
+# Вставки индексируются одним 'rebuild' после загрузки, удаления из messages снимает триггер.
+_MESSAGES_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5(
+    content,
+    conversation_uid UNINDEXED,
+    role UNINDEXED,
+    source_id UNINDEXED,
+    content='messages',
+    content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content, conversation_uid, role, source_id)
+    VALUES ('delete', old.id, old.content, old.conversation_uid, old.role, old.source_id);
+END;
+"""
+
+# Удаление беседы каскадно удаляет ее сообщения (а те через messages_fts_delete — строки FTS).
+# Триггер, а не FOREIGN KEY: внешний ключ потребовал бы пересоздать messages в существующих базах
+_CONVERSATIONS_CASCADE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS conversations_cascade_delete AFTER DELETE ON conversations BEGIN
+    DELETE FROM messages WHERE conversation_uid = old.conversation_uid;
+END;
+"""
+
+_RESET_SCHEMA = """
+DROP TABLE IF EXISTS conversations;
+DROP TABLE IF EXISTS messages;
+DROP TABLE IF EXISTS projects;
+DROP TABLE IF EXISTS messages_fts;
+DROP TABLE IF EXISTS imports;
+CREATE TABLE conversations (
+    conversation_uid TEXT PRIMARY KEY,
+    source_id TEXT NOT NULL,
+    conversation_id TEXT,
+    project_id TEXT,
+    project_uid TEXT,
+    title TEXT,
+    created_at REAL,
+    updated_at REAL,
+    snippet TEXT,
+    folder TEXT,
+    model TEXT
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_uid TEXT,
+    source_id TEXT,
+    role TEXT,
+    content TEXT,
+    created_at REAL
+);
+CREATE TABLE projects (
+    project_uid TEXT PRIMARY KEY,
+    source_id TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    human_name TEXT,
+    human_name_norm TEXT,
+    conversation_count INTEGER,
+    first_message_time REAL,
+    last_message_time REAL
+);
+CREATE TABLE imports (
+    import_id TEXT PRIMARY KEY,
+    source_id TEXT NOT NULL,
+    started_at REAL,
+    completed_at REAL,
+    conversations INTEGER
+);
+"""
+
+# Вторичные индексы создаются после массовой вставки (на свежей схеме их нет, пока идет загрузка)
+_INDEXES_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_conv_src_proj ON conversations(source_id, project_id);
+CREATE INDEX IF NOT EXISTS idx_msg_conv ON messages(conversation_uid);
+CREATE INDEX IF NOT EXISTS idx_projects_norm ON projects(human_name_norm);
+CREATE INDEX IF NOT EXISTS idx_conv_updated ON conversations(updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conv_project_updated ON conversations(project_uid, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conv_source_updated ON conversations(source_id, updated_at DESC);
+"""
+
+_EMPTY: Dict[str, Any] = {}  # общий пустой dict для цепочек .get(), только для чтения
+
+# Роли почти всегда из этого набора — экранировать их на каждом сообщении незачем
+_ROLE_HTML = {"user": "user", "assistant": "assistant", "unknown": "unknown"}
+# Неизменная часть HTML-страницы (стили и обертка) собирается один раз при импорте модуля
+_HTML_STYLE = "\n".join(
+    [
+        "<style>",
+        "html,body{min-height:100%; margin:0; padding:0; background:#0f172a;}",
+        "body{display:flex; justify-content:center; font-family:Arial, sans-serif; color:#e5e7eb;}",
+        ".page{width:min(50vw, 900px); padding:24px; margin:24px auto;}",
+        ".msg{border:1px solid rgba(255,255,255,0.08); border-radius:12px; padding:12px; margin-bottom:12px; background:#0c1220;}",
+        ".role{font-weight:700; text-transform:uppercase; font-size:12px; letter-spacing:1px; color:#38bdf8; margin-bottom:6px;}",
+        ".assistant .role{color:#fbbf24;}",
+        ".text{white-space:pre-wrap; font-size:14px; line-height:1.5;}",
+        ".attachments img{max-width:100%; border-radius:8px; margin-top:8px;}",
+        "</style>",
+        "</head><body>",
+        '<div class="page">',
+    ]
+)
+_HTML_SUFFIX = "</div></body></html>"
+_HTML_MESSAGE_TEMPLATE = (
+    '<div class="msg {role}">\n<div class="role">{role}</div>\n<div class="text">{text}</div>\n{attachments}</div>'
+)
+
+_PARALLEL_MIN_CONVERSATIONS = 32  # на маленьких экспортах запуск процессов дороже самой работы
+_IO_POOL_WORKERS = 8  # копирование вложений упирается в диск, GIL при этом отпускается
+
+# Размер порции executemany: до 5000 строк, но не больше лимита SQLite в 32766 параметров на запрос
+_SQLITE_MAX_PARAMS = 32766
+_CONVERSATIONS_BATCH = min(5000, _SQLITE_MAX_PARAMS // 11)
+_MESSAGES_BATCH = min(5000, _SQLITE_MAX_PARAMS // 5)
+_PROJECTS_BATCH = min(5000, _SQLITE_MAX_PARAMS // 8)
+
+_SQL_INSERT_CONVERSATION = (
+    "INSERT INTO conversations (conversation_uid, source_id, conversation_id, project_id, project_uid, title, created_at, updated_at, snippet, folder, model) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_SQL_INSERT_MESSAGE = "INSERT INTO messages (conversation_uid, source_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)"
+_SQL_DELETE_REPLACED_CONVERSATIONS = "DELETE FROM conversations WHERE conversation_uid IN (SELECT value FROM json_each(?))"
+# Все SQL импорта — константы; с большим кэшем sqlite3 не парсит их повторно между flush
+_STATEMENT_CACHE_SIZE = 1024
+
 
 @dataclass
 class ImportOptions:
@@ -32,6 +179,43 @@ class ImportOptions:
     allow_network_images: bool = False  # reserved flag, not implemented
     incremental: bool = False
     source_id: str = DEFAULT_SOURCE_ID
+    # conversation.json пишется всегда; остальные представления — по запросу (см. OUTPUT_FORMATS)
+    formats: Set[str] = field(default_factory=lambda: {"json"})
+    # Базу читают другие соединения (сервер): не выводим ее из WAL на время пересборки
+    keep_wal: bool = False
+
+
+def _zip_member_path(root: Path, name: str) -> Optional[Path]:
+    """Map a zip entry name to a path inside root (drops '..', absolute and drive prefixes like extractall)."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if parts and parts[0].endswith(":"):
+        parts = parts[1:]
+    return root.joinpath(*parts) if parts else None
+
+
+def _extract_zip(path: Path, target: Path) -> None:
+    """Extract all entries with large copy buffers, several entries at a time."""
+    with zipfile.ZipFile(path, "r") as zf:
+        jobs: List[Tuple[zipfile.ZipInfo, Path]] = []
+        # Каталоги создаем заранее, чтобы потоки не гонялись за mkdir
+        for info in zf.infolist():
+            dest = _zip_member_path(target, info.filename)
+            if dest is None:
+                continue
+            if info.is_dir():
+                ensure_dir(dest)
+                continue
+            ensure_dir(dest.parent)
+            jobs.append((info, dest))
+
+        def extract(job: Tuple[zipfile.ZipInfo, Path]) -> None:
+            info, dest = job
+            with zf.open(info) as src, dest.open("wb") as dst:
+                shutil.copyfileobj(src, dst, _ZIP_COPY_BUFFER)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            for _ in pool.map(extract, jobs):
+                pass
 
 
 def _unpack_export(path: Path) -> Tuple[Path, Optional[tempfile.TemporaryDirectory]]:
@@ -41,8 +225,7 @@ def _unpack_export(path: Path) -> Tuple[Path, Optional[tempfile.TemporaryDirecto
     if not path.suffix.lower().endswith("zip"):
         raise ValueError(f"Unsupported export type: {path}")
     tmpdir = tempfile.TemporaryDirectory(prefix="chatgpt-export-")
-    with zipfile.ZipFile(path, "r") as zf:
-        zf.extractall(tmpdir.name)
+    _extract_zip(path, Path(tmpdir.name))
     return Path(tmpdir.name), tmpdir
 
 
@@ -55,22 +238,25 @@ def _load_export_conversations(base: Path) -> List[Dict[str, Any]]:
             conversations_path = candidates[0]
         else:
             raise FileNotFoundError(f"conversations.json not found in {base}")
-    with conversations_path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = loads_json(conversations_path.read_bytes())
     if not isinstance(data, list):
         raise ValueError("conversations.json must contain a JSON array")
     return data
 
 
-def _build_asset_index(base: Path) -> Dict[str, Path]:
+def _build_asset_index(base: Path) -> Dict[str, str]:
     """Create mapping asset_id -> file path for exported images/assets."""
-    index: Dict[str, Path] = {}
-    for path in base.rglob("file_*"):
-        name = path.name
-        if not name.startswith("file_"):
-            continue
-        asset_id = name.split("-")[0]  # strip "-sanitized" suffix if present
-        index.setdefault(asset_id, path)
+    index: Dict[str, str] = {}
+    # os.scandir отдает тип записи без лишних stat, а имя фильтруем до создания каких-либо Path
+    stack = [str(base)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.startswith("file_"):
+                    asset_id = entry.name.split("-")[0]  # strip "-sanitized" suffix if present
+                    index.setdefault(asset_id, entry.path)
     return index
 
 
@@ -92,7 +278,7 @@ def _collect_model(messages: List[Dict[str, Any]]) -> Optional[str]:
     return None
 
 
-def _extract_message_payload(message: Dict[str, Any], asset_index: Dict[str, Path]) -> Tuple[str, List[Dict[str, Any]]]:
+def _extract_message_payload(message: Dict[str, Any], asset_index: Dict[str, str]) -> Tuple[str, List[Dict[str, Any]]]:
     """Return text and attachments for a message."""
     content = message.get("content")
     if not content:
@@ -112,7 +298,7 @@ def _extract_message_payload(message: Dict[str, Any], asset_index: Dict[str, Pat
                     {
                         "asset_id": asset_id,
                         "pointer": pointer,
-                        "source_path": str(src) if src else None,
+                        "source_path": src,
                         "width": part.get("width"),
                         "height": part.get("height"),
                         "size_bytes": part.get("size_bytes"),
@@ -138,31 +324,32 @@ def _extract_message_payload(message: Dict[str, Any], asset_index: Dict[str, Pat
 
 
 def _strip_inline_markers(text: str) -> str:
-    """Remove inline markers like financeturn0finance0 or cite tags."""
+    """Remove inline markers like <U+E200>finance<U+E202>turn0finance0<U+E201>, [cite:…] tags and 【…】 refs."""
     if not text:
         return text
-    # Удаляем блоки в формате ... (ChatGPT reasoning/refs маркеры)
-    text = re.sub(r"[^]*", "", text)
-    # Удаляем упоминания cite|finance маркеров в квадратных скобках, если остались
-    text = re.sub(r"\[cite:[^\]]+\]", "", text)
-    text = re.sub(r"\[finance:[^\]]+\]", "", text)
-    # Удаляем псевдо-ссылки формата 【turn6file4†L31-L39】
-    text = re.sub(r"【[^】]*】", "", text)
-    return text.strip()
-
-
-def _build_primary_path(mapping: Dict[str, Any], current_node: Optional[str]) -> List[str]:
-    """Pick a linearized path through the mapping. Prefers current_node chain, otherwise picks the latest leaf."""
+    # Быстрый отказ без regex: у всех маркеров есть литеральный префикс, а \ue200 и 【 не-ASCII
+    if "[cite:" not in text and "[finance:" not in text:
+        if text.isascii() or ("\ue200" not in text and "【" not in text):
+            return text.strip()
+    return _INLINE_MARKERS.sub("", text).strip()
+
+
+def _build_primary_path(mapping: Dict[str, Any], current_node: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Pick a linearized path through the mapping as (node_id, node) pairs.
+
+    Prefers current_node chain, otherwise picks the latest leaf.
+    """
     if not mapping:
         return []
 
-    def walk_to_root(node_id: str) -> List[str]:
-        chain: List[str] = []
+    def walk_to_root(node_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        chain: List[Tuple[str, Dict[str, Any]]] = []
         while node_id:
-            chain.append(node_id)
-            node = mapping.get(node_id) or {}
+            node = mapping.get(node_id) or _EMPTY
+            chain.append((node_id, node))
             node_id = node.get("parent")
-        return list(reversed(chain))
+        chain.reverse()
+        return chain
 
     if current_node and current_node in mapping:
         return walk_to_root(current_node)
@@ -170,7 +357,7 @@ def _build_primary_path(mapping: Dict[str, Any], current_node: Optional[str]) ->
     best_node = None
     best_ts = -1.0
     for node in mapping.values():
-        msg = node.get("message") or {}
+        msg = node.get("message") or _EMPTY
         ts = msg.get("create_time") or msg.get("update_time") or 0
         if ts >= best_ts:
             best_ts = ts
@@ -179,18 +366,17 @@ def _build_primary_path(mapping: Dict[str, Any], current_node: Optional[str]) ->
         return walk_to_root(best_node)
 
     # Fallback to arbitrary order
-    return [node.get("id") for node in mapping.values() if node.get("id")]
+    return [(node["id"], node) for node in mapping.values() if node.get("id")]
 
 
-def _extract_messages(mapping: Dict[str, Any], current_node: Optional[str], asset_index: Dict[str, Path]) -> List[Dict[str, Any]]:
-    path_ids = _build_primary_path(mapping, current_node)
+def _extract_messages(mapping: Dict[str, Any], current_node: Optional[str], asset_index: Dict[str, str]) -> List[Dict[str, Any]]:
     messages: List[Dict[str, Any]] = []
-    for node_id in path_ids:
-        node = mapping.get(node_id) or {}
+    # Узлы приходят вместе с id, повторно в mapping не ходим
+    for node_id, node in _build_primary_path(mapping, current_node):
         message = node.get("message")
         if not message:
             continue
-        role = (message.get("author") or {}).get("role") or "unknown"
+        role = (message.get("author") or _EMPTY).get("role") or "unknown"
         if role not in ("user", "assistant"):
             continue  # скрываем system/tool и прочие служебные сообщения
         metadata = message.get("metadata") or {}
@@ -221,81 +407,108 @@ def _build_conversation_folder(title: str, created_at: Optional[float], conversa
     return f"{date_prefix} - {readable_title}"
 
 
-def _copy_attachments(messages: List[Dict[str, Any]], asset_index: Dict[str, Path], chat_dir: Path, rel_folder: str) -> None:
+_IO_POOL: Optional[ThreadPoolExecutor] = None
+_IO_POOL_PID: Optional[int] = None
+
+
+def _io_pool() -> ThreadPoolExecutor:
+    """Thread pool for attachment I/O, created lazily per process (pool threads do not survive fork)."""
+    global _IO_POOL, _IO_POOL_PID
+    if _IO_POOL is None or _IO_POOL_PID != os.getpid():
+        _IO_POOL = ThreadPoolExecutor(max_workers=_IO_POOL_WORKERS, thread_name_prefix="attachments")
+        _IO_POOL_PID = os.getpid()
+    return _IO_POOL
+
+
+def _link_or_copy(src: str, dest: Path) -> None:
+    """Hardlink src to dest (no data copied); fall back to a real copy across devices or on unsupported FS."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy(src, dest)
+
+
+def _copy_attachments(messages: List[Dict[str, Any]], asset_index: Dict[str, str], chat_dir: Path, rel_folder: str) -> None:
+    if not any(msg.get("attachments") for msg in messages):
+        return
     image_dir = chat_dir / "images"
+    image_dir_ready = False
     copied: Dict[str, Path] = {}
+    copies: List[Future] = []
     for msg in messages:
         for attachment in msg.get("attachments", []) or []:
             asset_id = attachment.get("asset_id")
             src = asset_index.get(asset_id) if asset_id else None
-            if not src or not src.exists():
+            if not src or not os.path.exists(src):
                 continue
-            ensure_dir(image_dir)
-            dest_name = src.name  # сохраняем оригинальное имя (с суффиксом -sanitized)
+            if not image_dir_ready:
+                # папку создаем один раз и только если есть что копировать
+                ensure_dir(image_dir)
+                image_dir_ready = True
+            dest_name = os.path.basename(src)  # сохраняем оригинальное имя (с суффиксом -sanitized)
             dest_path = image_dir / dest_name
             if asset_id not in copied:
-                shutil.copy(src, dest_path)
+                copies.append(_io_pool().submit(_link_or_copy, src, dest_path))
                 copied[asset_id] = dest_path
             rel_path = f"{rel_folder}/images/{dest_name}"
             attachment["local_path"] = f"images/{dest_name}"
             attachment["path"] = rel_path  # для веб-выдачи через /files/
+    for future in copies:
+        future.result()
 
 
-def _write_markdown(conv_title: str, created_at: Optional[float], messages: List[Dict[str, Any]], dest: Path) -> None:
-    lines = [f"# {conv_title or 'Untitled'}", f"Дата: {ts_to_human(created_at)}", "", "---", ""]
+def _write_utf8(path: Path, text: str) -> None:
+    """Encode once and write raw bytes (no TextIOWrapper, no newline translation)."""
+    path.write_bytes(text.encode("utf-8"))
+
+
+def _markdown_lines(conv_title: str, created_at: Optional[float], messages: List[Dict[str, Any]]) -> Iterable[str]:
+    yield f"# {conv_title or 'Untitled'}"
+    yield f"Дата: {ts_to_human(created_at)}"
+    yield ""
+    yield "---"
+    yield ""
     for msg in messages:
-        role = msg.get("role", "unknown").capitalize()
-        text = msg.get("text") or ""
-        lines.append(f"**{role}:**  ")
-        lines.append(text)
-        attachments = msg.get("attachments") or []
-        for att in attachments:
+        yield f"**{msg.get('role', 'unknown').capitalize()}:**  "
+        yield msg.get("text") or ""
+        for att in msg.get("attachments") or ():
             if att.get("local_path"):
-                lines.append(f"![image]({att['local_path']})")
-        lines.append("")
-    dest.write_text("\n".join(lines), encoding="utf-8")
+                yield f"![image]({att['local_path']})"
+        yield ""
+
+
+def _write_markdown(conv_title: str, created_at: Optional[float], messages: List[Dict[str, Any]], dest: Path) -> None:
+    _write_utf8(dest, "\n".join(_markdown_lines(conv_title, created_at, messages)))
 
 
 def _write_html(conv_title: str, created_at: Optional[float], messages: List[Dict[str, Any]], dest: Path) -> None:
     esc = html.escape
+    title = esc(conv_title or "Untitled")
     lines = [
-        "<!doctype html>",
-        "<html><head>",
-        '<meta charset="UTF-8" />',
-        f"<title>{esc(conv_title or 'Untitled')}</title>",
-        "<style>",
-        "html,body{min-height:100%; margin:0; padding:0; background:#0f172a;}",
-        "body{display:flex; justify-content:center; font-family:Arial, sans-serif; color:#e5e7eb;}",
-        ".page{width:min(50vw, 900px); padding:24px; margin:24px auto;}",
-        ".msg{border:1px solid rgba(255,255,255,0.08); border-radius:12px; padding:12px; margin-bottom:12px; background:#0c1220;}",
-        ".role{font-weight:700; text-transform:uppercase; font-size:12px; letter-spacing:1px; color:#38bdf8; margin-bottom:6px;}",
-        ".assistant .role{color:#fbbf24;}",
-        ".text{white-space:pre-wrap; font-size:14px; line-height:1.5;}",
-        ".attachments img{max-width:100%; border-radius:8px; margin-top:8px;}",
-        "</style>",
-        "</head><body>",
-        '<div class="page">',
-        f"<h1>{esc(conv_title or 'Untitled')}</h1>",
-        f"<div>Дата: {esc(ts_to_human(created_at))}</div>",
-        "<hr/>",
+        f"<!doctype html>\n<html><head>\n<meta charset=\"UTF-8\" />\n<title>{title}</title>",
+        _HTML_STYLE,
+        f"<h1>{title}</h1>\n<div>Дата: {esc(ts_to_human(created_at))}</div>\n<hr/>",
     ]
     for msg in messages:
         role = msg.get("role", "unknown")
-        text = msg.get("text") or ""
-        lines.append(f'<div class="msg {esc(role)}">')
-        lines.append(f'<div class="role">{esc(role)}</div>')
-        lines.append(f'<div class="text">{esc(text)}</div>')
         attachments = msg.get("attachments") or []
+        atts_html = ""
         if attachments:
-            lines.append('<div class="attachments">')
-            for att in attachments:
-                local = att.get("local_path")
-                if local:
-                    lines.append(f'<img src="{esc(local)}" alt="{esc(att.get("asset_id","image"))}"/>')
-            lines.append("</div>")
-        lines.append("</div>")
-    lines.append("</div></body></html>")
-    dest.write_text("\n".join(lines), encoding="utf-8")
+            images = "".join(
+                f'<img src="{esc(att["local_path"])}" alt="{esc(att.get("asset_id", "image"))}"/>\n'
+                for att in attachments
+                if att.get("local_path")
+            )
+            atts_html = f'<div class="attachments">\n{images}</div>\n'
+        lines.append(
+            _HTML_MESSAGE_TEMPLATE.format(
+                role=_ROLE_HTML.get(role) or esc(role),
+                text=esc(msg.get("text") or ""),
+                attachments=atts_html,
+            )
+        )
+    lines.append(_HTML_SUFFIX)
+    _write_utf8(dest, "\n".join(lines))
 
 
 def _write_obsidian(
@@ -327,73 +540,44 @@ def _write_obsidian(
                 # Obsidian поддерживает относительные ссылки на изображения
                 body.append(f"![[{att['local_path']}]]")
         body.append("")
-    dest.write_text("\n".join(frontmatter + body), encoding="utf-8")
+    _write_utf8(dest, "\n".join(frontmatter + body))
+
+
+def _execute_statements(conn: sqlite3.Connection, script: str) -> None:
+    """Run a multi-statement script one execute at a time (executescript would COMMIT an open transaction)."""
+    pending = ""
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            conn.execute(pending)
+            pending = ""
+    if pending.strip():
+        conn.execute(pending)
 
 
-def _prepare_database(path: Path, rebuild: bool) -> sqlite3.Connection:
+def _reset_schema(conn: sqlite3.Connection) -> None:
+    """Drop and recreate all archive tables; inside a transaction WAL readers keep the old snapshot until COMMIT."""
+    _execute_statements(conn, _RESET_SCHEMA)
+    _execute_statements(conn, _MESSAGES_FTS_SCHEMA)
+    conn.execute(_CONVERSATIONS_CASCADE_TRIGGER)
+
+
+def _prepare_database(path: Path, rebuild: bool, defer_reset: bool = False) -> sqlite3.Connection:
+    """Open index.db, creating or migrating the schema; with defer_reset a rebuild is left to the caller."""
     ensure_dir(path.parent)
     file_existed = path.exists()
-    conn = sqlite3.connect(path)
+    # Автокоммит на уровне модуля sqlite3: транзакции импорта открываем и закрываем сами (BEGIN/COMMIT)
+    conn = sqlite3.connect(path, isolation_level=None, cached_statements=_STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
     except sqlite3.OperationalError:
         # На некоторых FS (сетевые/смонтированные) WAL может быть недоступен.
         pass
-    def reset_schema() -> None:
-        conn.executescript(
-            """
-            DROP TABLE IF EXISTS conversations;
-            DROP TABLE IF EXISTS messages;
-            DROP TABLE IF EXISTS projects;
-            DROP TABLE IF EXISTS messages_fts;
-            DROP TABLE IF EXISTS imports;
-            CREATE TABLE conversations (
-                conversation_uid TEXT PRIMARY KEY,
-                source_id TEXT NOT NULL,
-                conversation_id TEXT,
-                project_id TEXT,
-                project_uid TEXT,
-                title TEXT,
-                created_at REAL,
-                updated_at REAL,
-                snippet TEXT,
-                folder TEXT,
-                model TEXT
-            );
-            CREATE TABLE messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_uid TEXT,
-                source_id TEXT,
-                role TEXT,
-                content TEXT,
-                created_at REAL
-            );
-            CREATE TABLE projects (
-                project_uid TEXT PRIMARY KEY,
-                source_id TEXT NOT NULL,
-                project_id TEXT NOT NULL,
-                human_name TEXT,
-                conversation_count INTEGER,
-                first_message_time REAL,
-                last_message_time REAL
-            );
-            CREATE VIRTUAL TABLE messages_fts USING fts5(
-                content,
-                conversation_uid UNINDEXED,
-                role UNINDEXED,
-                source_id UNINDEXED
-            );
-            CREATE TABLE imports (
-                import_id TEXT PRIMARY KEY,
-                source_id TEXT NOT NULL,
-                started_at REAL,
-                completed_at REAL,
-                conversations INTEGER
-            );
-            """
-        )
 
+    if rebuild and defer_reset:
+        # Пересборку схемы выполнит вызывающий внутри своей транзакции (см. _reset_schema)
+        return conn
     needs_reset = rebuild or not file_existed
     if not needs_reset:
         try:
@@ -403,10 +587,68 @@ def _prepare_database(path: Path, rebuild: bool) -> sqlite3.Connection:
             needs_reset = True
 
     if needs_reset:
-        reset_schema()
+        _reset_schema(conn)
+    else:
+        _migrate_schema(conn)
     return conn
 
 
+def _migrate_schema(conn: sqlite3.Connection) -> None:
+    """Bring an existing index.db up to the current schema without dropping imported data."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+    fts_sql = (row[0] or "") if row else ""
+    if "content='messages'" not in fts_sql.replace('"', "'"):
+        # Старый FTS хранил копию текста; пересоздаем как external-content индекс над messages
+        conn.execute("DROP TABLE IF EXISTS messages_fts")
+        conn.executescript(_MESSAGES_FTS_SCHEMA)
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+        conn.commit()
+    project_cols = {row[1] for row in conn.execute("PRAGMA table_info(projects)")}
+    if project_cols and "human_name_norm" not in project_cols:
+        # Нормализация (NFKC, пробелы, регистр) делается в Python, поэтому колонку заполняем здесь же
+        conn.execute("ALTER TABLE projects ADD COLUMN human_name_norm TEXT")
+        conn.executemany(
+            "UPDATE projects SET human_name_norm = ? WHERE project_uid = ?",
+            [
+                (normalize_project_name(name), uid)
+                for uid, name in conn.execute("SELECT project_uid, human_name FROM projects").fetchall()
+            ],
+        )
+        conn.commit()
+    conn.execute(_CONVERSATIONS_CASCADE_TRIGGER)
+    conn.commit()
+    _ensure_indexes(conn)
+
+
+def _ensure_indexes(conn: sqlite3.Connection) -> None:
+    # По одному execute, а не executescript: тот закоммитил бы открытую транзакцию импорта
+    for statement in _INDEXES_SCHEMA.strip().splitlines():
+        conn.execute(statement)
+
+
+def _enable_bulk_load_pragmas(conn: sqlite3.Connection, keep_wal: bool = False) -> None:
+    """Trade durability for insert speed while a full rebuild fills a fresh schema."""
+    # Архив всегда можно пересобрать из экспорта, поэтому fsync на время пересборки не нужен.
+    # Журнал держим в памяти, а не выключаем: без журнала ROLLBACK при ошибке импорта не определен
+    conn.execute("PRAGMA synchronous=OFF;")
+    # keep_wal: в режиме с журналом писатель блокировал бы читателей до конца импорта, а WAL сохраняет им снимок
+    if not keep_wal:
+        try:
+            conn.execute("PRAGMA journal_mode=MEMORY;")
+        except sqlite3.OperationalError:
+            pass
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-65536;")
+
+
+def _restore_default_pragmas(conn: sqlite3.Connection) -> None:
+    try:
+        conn.execute("PRAGMA journal_mode=WAL;")
+    except sqlite3.OperationalError:
+        pass
+    conn.execute("PRAGMA synchronous=NORMAL;")
+
+
 def _refresh_projects_table(conn: sqlite3.Connection, output_root: Path, name_overrides: Dict[str, str]) -> None:
     rows = conn.execute(
         "SELECT source_id, project_id, COUNT(*) AS cnt, MIN(created_at) AS first_message_time, MAX(updated_at) AS last_message_time "
@@ -430,199 +672,374 @@ def _refresh_projects_table(conn: sqlite3.Connection, output_root: Path, name_ov
             "first_message_time": r["first_message_time"],
             "last_message_time": r["last_message_time"],
         }
-        meta_path = projects_root / source_id / project_id / "_meta.json"
-        ensure_dir(meta_path.parent)
-        write_json(meta_path, meta_payload)
+        # write_json сам создает папку проекта — отдельный ensure_dir здесь был бы вторым makedirs
+        write_json(projects_root / source_id / project_id / "_meta.json", meta_payload)
         project_rows.append(
             (
                 project_uid,
                 source_id,
                 project_id,
                 human_name,
+                normalize_project_name(human_name),
                 r["cnt"],
                 r["first_message_time"],
                 r["last_message_time"],
             )
         )
-    if project_rows:
+    for batch in batched(project_rows, _PROJECTS_BATCH):
         conn.executemany(
-            "INSERT INTO projects (project_uid, source_id, project_id, human_name, conversation_count, first_message_time, last_message_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            project_rows,
+            "INSERT INTO projects (project_uid, source_id, project_id, human_name, human_name_norm, conversation_count, first_message_time, last_message_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
         )
 
 
+@dataclass
+class _ConversationContext:
+    """Read-only state shared by every conversation of one import (picklable for worker processes)."""
+
+    source_id: str
+    output_root: Path
+    asset_index: Dict[str, str]
+    move_overrides: Dict[str, str]
+    project_move_overrides: Dict[str, str]
+    existing_map: Dict[str, Dict[str, Any]]
+    incremental: bool
+    formats: Set[str]
+
+
+_WORKER_CONTEXT: Optional[_ConversationContext] = None
+
+
+def _init_worker(context: _ConversationContext) -> None:
+    global _WORKER_CONTEXT
+    _WORKER_CONTEXT = context
+
+
+def _process_group_in_worker(group: List[Tuple[int, Dict[str, Any]]]) -> List[Optional[Dict[str, Any]]]:
+    return [_process_conversation(item, _WORKER_CONTEXT) for item in group]  # type: ignore[arg-type]
+
+
+def _group_by_chat_folder(
+    conversations: List[Dict[str, Any]], source_id: str, existing_map: Dict[str, Dict[str, Any]], incremental: bool
+) -> List[List[Tuple[int, Dict[str, Any]]]]:
+    """Split conversations into groups that never share a chat folder, keeping source order inside each group.
+
+    Folder names are "<date> - <title>", so several "New chat" of one day land in the same directory; such
+    conversations (and, in incremental mode, those whose old folder is removed) must be written by one worker
+    in source order, like the serial import where the last writer wins. Keys are derived conservatively:
+    without create_time the date comes from the messages, so the whole title becomes one key. Keys are casefolded,
+    since "New Chat" and "New chat" share one directory on case-insensitive filesystems.
+    """
+    titles: List[str] = []
+    undated_titles: Set[str] = set()
+    for conversation in conversations:
+        title_key = safe_name(conversation.get("title") or f"Untitled {str(conversation.get('id') or '')[:8]}").casefold()
+        titles.append(title_key)
+        if not conversation.get("create_time"):
+            undated_titles.add(title_key)
+
+    def folder_key(folder_name: str) -> str:
+        folder_name = folder_name.casefold()
+        title_key = folder_name.partition(" - ")[2]
+        return title_key if title_key in undated_titles else folder_name
+
+    parent: Dict[str, str] = {}
+
+    def find(key: str) -> str:
+        root = parent.setdefault(key, key)
+        while root != parent[root]:
+            root = parent[root]
+        while key != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    item_keys: List[str] = []
+    for conversation, title_key in zip(conversations, titles):
+        if title_key in undated_titles:
+            key = title_key
+        else:
+            key = folder_key(f"{ts_to_date_str(conversation.get('create_time'))} - {title_key}")
+        root = find(key)
+        if incremental and conversation.get("id"):
+            old_folder = (existing_map.get(make_conversation_uid(source_id, conversation["id"])) or {}).get("folder")
+            if old_folder:
+                # Старую папку удаляет воркер этой беседы — она не должна пересекаться с чужой записью
+                parent[find(folder_key(Path(old_folder).name))] = root
+        item_keys.append(key)
+
+    groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for idx, (conversation, key) in enumerate(zip(conversations, item_keys)):
+        groups.setdefault(find(key), []).append((idx, conversation))
+    return list(groups.values())
+
+
+def _process_conversation(item: Tuple[int, Dict[str, Any]], ctx: _ConversationContext) -> Optional[Dict[str, Any]]:
+    """Write one conversation to disk and return its DB rows.
+
+    Returns None for conversations without visible messages and {"skipped": True, ...}
+    for conversations that are not newer than the archived copy (incremental mode).
+    """
+    idx, conversation = item
+    source_id = ctx.source_id
+    source_folder = source_id
+    output_root = ctx.output_root
+    projects_root = output_root / "projects"
+    asset_index = ctx.asset_index
+    move_overrides = ctx.move_overrides
+    project_move_overrides = ctx.project_move_overrides
+
+    conv_id = generate_conversation_id(conversation.get("id"))
+    conv_uid = make_conversation_uid(source_id, conv_id)
+    title = conversation.get("title") or f"Untitled {conv_id[:8]}"
+    mapping = conversation.get("mapping") or {}
+    current_node = conversation.get("current_node")
+    messages = _extract_messages(mapping, current_node, asset_index)
+    if not messages:
+        return None
+    created_at = conversation.get("create_time") or messages[0].get("timestamp")
+    updated_at = conversation.get("update_time") or messages[-1].get("timestamp")
+    gizmo_id = _collect_gizmo_id(messages) or "no_project"
+    model = _collect_model(messages)
+    target_project_override = move_overrides.get(conv_uid) or move_overrides.get(conv_id)
+    if target_project_override:
+        override_source, override_project = split_project_uid(str(target_project_override))
+        if override_source == source_id:
+            gizmo_id = override_project
+    elif project_move_overrides:
+        project_override = project_move_overrides.get(make_project_uid(source_id, gizmo_id)) or project_move_overrides.get(gizmo_id)
+        if project_override:
+            override_source, override_project = split_project_uid(str(project_override))
+            if override_source == source_id:
+                gizmo_id = override_project
+
+    existing_info = ctx.existing_map.get(conv_uid)
+    existing_updated = (existing_info or {}).get("updated_at")
+    if ctx.incremental and existing_info and updated_at and existing_updated and updated_at <= existing_updated:
+        return {"skipped": True, "model": model}
+
+    folder_name = _build_conversation_folder(title, created_at, conv_id)
+    project_uid = make_project_uid(source_id, gizmo_id)
+    project_dir = projects_root / source_folder / gizmo_id
+    chat_dir = project_dir / folder_name
+    if chat_dir.exists():
+        shutil.rmtree(chat_dir, ignore_errors=True)
+    ensure_dir(chat_dir)
+    rel_folder = f"projects/{source_folder}/{gizmo_id}/{folder_name}"
+
+    if ctx.incremental and existing_info:
+        # Удаляем старую папку чата (вдруг имя изменилось); строки БД удалит основной процесс
+        old_folder = existing_info.get("folder")
+        if old_folder:
+            old_path = (output_root / old_folder).resolve()
+            try:
+                if output_root in old_path.parents or output_root == old_path:
+                    shutil.rmtree(old_path, ignore_errors=True)
+            except Exception:
+                pass
+
+    _copy_attachments(messages, asset_index, chat_dir, rel_folder)
+
+    conversation_json = {
+        "conversation_uid": conv_uid,
+        "conversation_id": conv_id,
+        "project_id": gizmo_id,
+        "project_uid": project_uid,
+        "source_id": source_id,
+        "source_index": idx,
+        "title": title,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "messages": messages,
+        "metadata": {
+            "gizmo_id": gizmo_id,
+            "model": model,
+            "source_id": source_id,
+        },
+        "files": {key: name for fmt, (key, name) in _FORMAT_FILES.items() if fmt in ctx.formats},
+    }
+    # conversation.json читает только сервер — отступы лишь замедляют запись
+    write_json(chat_dir / "conversation.json", conversation_json, indent=False)
+    if "md" in ctx.formats:
+        _write_markdown(title, created_at, messages, chat_dir / "conversation.md")
+    if "html" in ctx.formats:
+        _write_html(title, created_at, messages, chat_dir / "conversation.html")
+    if "obsidian" in ctx.formats:
+        _write_obsidian(title, created_at, project_uid, model, messages, chat_dir / "conversation-obsidian.md")
+
+    snippet = ""
+    for msg in messages:
+        if msg.get("role") == "user":
+            snippet = (msg.get("text") or "")[:240]
+            break
+
+    return {
+        "skipped": False,
+        "model": model,
+        "replaces_existing": bool(ctx.incremental and existing_info),
+        "conversation_row": (
+            conv_uid,
+            source_id,
+            conv_id,
+            gizmo_id,
+            project_uid,
+            title,
+            created_at,
+            updated_at,
+            snippet,
+            rel_folder,
+            model,
+        ),
+        "message_rows": [
+            (conv_uid, source_id, msg.get("role"), msg.get("text"), msg.get("timestamp")) for msg in messages
+        ],
+    }
+
+
 def import_archive(options: ImportOptions) -> Dict[str, Any]:
     export_base, tmpdir = _unpack_export(options.export_path)
     try:
         raw_conversations = _load_export_conversations(export_base)
         asset_index = _build_asset_index(export_base)
         source_id = normalize_source_id(options.source_id)
-        source_folder = source_id
         output_root = options.output_root
         ensure_dir(output_root)
         projects_root = output_root / "projects"
         ensure_dir(projects_root)
         overrides = load_project_overrides(output_root)
         name_overrides = overrides.get("names", {})
-        move_overrides = overrides.get("moves", {})
-        project_move_overrides = overrides.get("project_moves", {})
 
         db_path = output_root / "index.db"
-        conn = _prepare_database(db_path, rebuild=not options.incremental)
+        conn = _prepare_database(db_path, rebuild=not options.incremental, defer_reset=True)
+        if not options.incremental:
+            _enable_bulk_load_pragmas(conn, keep_wal=options.keep_wal)
+        try:
+            # Все чтения/записи импорта идут одной явной транзакцией, без автокоммитов между executemany.
+            # Пересоздание схемы — в ней же: читатели до COMMIT видят прежнюю базу, а не пустые или удаленные таблицы
+            conn.execute("BEGIN IMMEDIATE")
+            if not options.incremental:
+                _reset_schema(conn)
 
-        existing_map: Dict[str, Dict[str, Any]] = {}
-        if options.incremental:
-            try:
-                cursor = conn.execute(
-                    "SELECT conversation_uid, updated_at, folder FROM conversations WHERE source_id = ?",
-                    (source_id,),
-                )
-                for row in cursor.fetchall():
-                    existing_map[row[0]] = {"updated_at": row[1], "folder": row[2]}
-            except Exception:
-                existing_map = {}
-
-        conversations_rows: List[Tuple[Any, ...]] = []
-        messages_rows: List[Tuple[Any, ...]] = []
-        fts_rows: List[Tuple[Any, ...]] = []
-        model_set = set()
-        imported_count = 0
-        skipped_existing = 0
-
-        for idx, conversation in enumerate(raw_conversations):
-            conv_id = generate_conversation_id(conversation.get("id"))
-            conv_uid = make_conversation_uid(source_id, conv_id)
-            title = conversation.get("title") or f"Untitled {conv_id[:8]}"
-            mapping = conversation.get("mapping") or {}
-            current_node = conversation.get("current_node")
-            messages = _extract_messages(mapping, current_node, asset_index)
-            if not messages:
-                continue
-            created_at = conversation.get("create_time") or messages[0].get("timestamp")
-            updated_at = conversation.get("update_time") or messages[-1].get("timestamp")
-            gizmo_id = _collect_gizmo_id(messages) or "no_project"
-            model = _collect_model(messages)
-            if model:
-                model_set.add(model)
-            target_project_override = move_overrides.get(conv_uid) or move_overrides.get(conv_id)
-            if target_project_override:
-                override_source, override_project = split_project_uid(str(target_project_override))
-                if override_source == source_id:
-                    gizmo_id = override_project
-            elif project_move_overrides:
-                project_override = project_move_overrides.get(make_project_uid(source_id, gizmo_id)) or project_move_overrides.get(gizmo_id)
-                if project_override:
-                    override_source, override_project = split_project_uid(str(project_override))
-                    if override_source == source_id:
-                        gizmo_id = override_project
-
-            existing_info = existing_map.get(conv_uid)
-            existing_updated = (existing_info or {}).get("updated_at")
-            if options.incremental and existing_info and updated_at and existing_updated and updated_at <= existing_updated:
-                skipped_existing += 1
-                continue
+            existing_map: Dict[str, Dict[str, Any]] = {}
+            if options.incremental:
+                try:
+                    cursor = conn.execute(
+                        "SELECT conversation_uid, updated_at, folder FROM conversations WHERE source_id = ?",
+                        (source_id,),
+                    )
+                    for row in cursor.fetchall():
+                        existing_map[row[0]] = {"updated_at": row[1], "folder": row[2]}
+                except Exception:
+                    existing_map = {}
 
-            folder_name = _build_conversation_folder(title, created_at, conv_id)
-            project_uid = make_project_uid(source_id, gizmo_id)
-            project_dir = projects_root / source_folder / gizmo_id
-            chat_dir = project_dir / folder_name
-            if chat_dir.exists():
-                shutil.rmtree(chat_dir, ignore_errors=True)
-            ensure_dir(chat_dir)
-            rel_folder = f"projects/{source_folder}/{gizmo_id}/{folder_name}"
+            context = _ConversationContext(
+                source_id=source_id,
+                output_root=output_root,
+                asset_index=asset_index,
+                move_overrides=overrides.get("moves", {}),
+                project_move_overrides=overrides.get("project_moves", {}),
+                existing_map=existing_map,
+                incremental=options.incremental,
+                formats=set(options.formats),
+            )
 
-            if options.incremental:
-                # Удаляем старые данные, если были, и старую папку чата (вдруг имя изменилось)
-                if existing_info:
-                    old_folder = existing_info.get("folder")
-                    if old_folder:
-                        old_path = (output_root / old_folder).resolve()
-                        try:
-                            if output_root in old_path.parents or output_root == old_path:
-                                shutil.rmtree(old_path, ignore_errors=True)
-                        except Exception:
-                            pass
-                conn.execute("DELETE FROM messages WHERE conversation_uid = ?", (conv_uid,))
-                conn.execute("DELETE FROM messages_fts WHERE conversation_uid = ?", (conv_uid,))
-                conn.execute("DELETE FROM conversations WHERE conversation_uid = ?", (conv_uid,))
-
-            _copy_attachments(messages, asset_index, chat_dir, rel_folder)
-
-            conversation_json = {
-                "conversation_uid": conv_uid,
-                "conversation_id": conv_id,
-                "project_id": gizmo_id,
-                "project_uid": project_uid,
-                "source_id": source_id,
-                "source_index": idx,
-                "title": title,
-                "created_at": created_at,
-                "updated_at": updated_at,
-                "messages": messages,
-                "metadata": {
-                    "gizmo_id": gizmo_id,
-                    "model": model,
-                    "source_id": source_id,
-                },
-                "files": {
-                    "markdown": "conversation.md",
-                    "html": "conversation.html",
-                    "obsidian": "conversation-obsidian.md",
-                },
-            }
-            write_json(chat_dir / "conversation.json", conversation_json)
-            _write_markdown(title, created_at, messages, chat_dir / "conversation.md")
-            _write_html(title, created_at, messages, chat_dir / "conversation.html")
-            _write_obsidian(title, created_at, project_uid, model, messages, chat_dir / "conversation-obsidian.md")
-
-            snippet = ""
-            for msg in messages:
-                if msg.get("role") == "user":
-                    snippet = (msg.get("text") or "")[:240]
-                    break
-
-            conversations_rows.append(
-                (
-                    conv_uid,
-                    source_id,
-                    conv_id,
-                    gizmo_id,
-                    project_uid,
-                    title,
-                    created_at,
-                    updated_at,
-                    snippet,
-                    rel_folder,
-                    model,
+            fts_watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+            conversations_rows: List[Tuple[Any, ...]] = []
+            messages_rows: List[Tuple[Any, ...]] = []
+            replaced_uids: List[str] = []
+            model_set = set()
+            imported_count = 0
+            skipped_existing = 0
+
+            def flush_rows() -> None:
+                # Пишем накопленное порциями, чтобы не держать в памяти строки всего экспорта.
+                # Старые версии обновленных бесед удаляем одним запросом до вставки новых.
+                if replaced_uids:
+                    payload = json.dumps(replaced_uids)
+                    conn.execute(_SQL_DELETE_REPLACED_CONVERSATIONS, (payload,))  # сообщения снимает триггер
+                    replaced_uids.clear()
+                for batch in batched(conversations_rows, _CONVERSATIONS_BATCH):
+                    conn.executemany(_SQL_INSERT_CONVERSATION, batch)
+                for batch in batched(messages_rows, _MESSAGES_BATCH):
+                    conn.executemany(_SQL_INSERT_MESSAGE, batch)
+                conversations_rows.clear()
+                messages_rows.clear()
+
+            # Беседы независимы: рендер и запись файлов раздаем по процессам, в SQLite пишет только основной.
+            # Беседы с общей папкой чата идут одной группой в один воркер, иначе процессы удаляют файлы друг друга.
+            workers = os.cpu_count() or 1
+            pool: Optional[ProcessPoolExecutor] = None
+            if workers > 1 and len(raw_conversations) >= _PARALLEL_MIN_CONVERSATIONS:
+                groups = _group_by_chat_folder(raw_conversations, source_id, existing_map, options.incremental)
+                # spawn, а не fork: импорт запускается и из фонового потока многопоточного сервера,
+                # а fork копирует чужие захваченные блокировки в дочерний процесс
+                pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(context,),
                 )
-            )
-            for msg in messages:
-                messages_rows.append(
-                    (conv_uid, source_id, msg.get("role"), msg.get("text"), msg.get("timestamp"))
+                results: Iterable[Optional[Dict[str, Any]]] = chain.from_iterable(
+                    pool.map(_process_group_in_worker, groups, chunksize=16)
                 )
-                fts_rows.append((msg.get("text") or "", conv_uid, msg.get("role"), source_id))
-            imported_count += 1
+            else:
+                results = (_process_conversation(item, context) for item in enumerate(raw_conversations))
 
-        # Persist DB data
-        conn.executemany(
-            "INSERT INTO conversations (conversation_uid, source_id, conversation_id, project_id, project_uid, title, created_at, updated_at, snippet, folder, model) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            conversations_rows,
-        )
-        conn.executemany(
-            "INSERT INTO messages (conversation_uid, source_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
-            messages_rows,
-        )
-        conn.executemany(
-            "INSERT INTO messages_fts (content, conversation_uid, role, source_id) VALUES (?, ?, ?, ?)",
-            fts_rows,
-        )
+            completed = False
+            try:
+                for result in results:
+                    if result is None:
+                        continue
+                    if result["model"]:
+                        model_set.add(result["model"])
+                    if result["skipped"]:
+                        skipped_existing += 1
+                        continue
+                    if result["replaces_existing"]:
+                        replaced_uids.append(result["conversation_row"][0])
+                    conversations_rows.append(result["conversation_row"])
+                    messages_rows.extend(result["message_rows"])
+                    imported_count += 1
+                    if len(conversations_rows) >= _CONVERSATIONS_BATCH or len(messages_rows) >= _MESSAGES_BATCH:
+                        flush_rows()
+                completed = True
+            finally:
+                if pool is not None:
+                    # При ошибке не ждем оставшиеся в очереди группы
+                    pool.shutdown(cancel_futures=not completed)
 
-        _refresh_projects_table(conn, output_root, name_overrides)
-        conn.commit()
+            # Persist DB data
+            flush_rows()
+            if options.incremental:
+                # Индексируем только добавленные строки (AUTOINCREMENT: новые id всегда больше старых)
+                conn.execute(
+                    "INSERT INTO messages_fts (rowid, content, conversation_uid, role, source_id) "
+                    "SELECT id, content, conversation_uid, role, source_id FROM messages WHERE id > ?",
+                    (fts_watermark,),
+                )
+            else:
+                conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+
+            _ensure_indexes(conn)
+            _refresh_projects_table(conn, output_root, name_overrides)
+            # Данные поменялись: обновляем статистику планировщика для запросов списка бесед сервера
+            conn.execute("ANALYZE conversations")
+            conn.execute("COMMIT")
+            if not options.incremental:
+                _restore_default_pragmas(conn)
+            project_count = conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if not options.incremental:
+                # Возвращаем базу в WAL и после неудачной пересборки
+                _restore_default_pragmas(conn)
+            raise
+        finally:
+            conn.close()
 
         return {
-            "conversations": len(conversations_rows),
-            "projects": conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0],
+            "conversations": imported_count,
+            "projects": project_count,
             "models": sorted(model_set),
             "db_path": str(db_path),
             "output_root": str(output_root),
@@ -1,45 +1,76 @@
+import errno
 import http.server
+import io
 import json
 import mimetypes
+import os
 import re
 import shutil
-import socketserver
 import sqlite3
-import unicodedata
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List
-from urllib.parse import parse_qs, quote, urlparse, unquote
-
-from .importer import ImportOptions, import_archive, _prepare_database
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, quote, unquote
+
+from .importer import (
+    OUTPUT_FORMATS,
+    ImportOptions,
+    import_archive,
+    _STATEMENT_CACHE_SIZE,
+    _migrate_schema,
+    _prepare_database,
+)
 from .utils import (
     DEFAULT_SOURCE_ID,
+    batched,
+    dumps_json,
     ensure_dir,
     load_project_overrides,
+    loads_json,
     make_project_uid,
+    normalize_project_name,
     normalize_source_id,
     save_project_overrides,
     split_project_uid,
     write_json,
 )
 
-def normalize_project_name(value: str) -> str:
-    raw = (value or "").strip()
-    try:
-        normalized = unicodedata.normalize("NFKC", raw)
-    except Exception:
-        normalized = raw
-    normalized = re.sub(r"\s+", " ", normalized)
-    return normalized.strip().lower()
+_PROJECT_ID_INVALID_RE = re.compile(r"[^a-zA-Z0-9._-]+")
+_FILENAME_INVALID_RE = re.compile(r"[^A-Za-z0-9._-]+")
+# rm -rf обходит дерево в C; на больших projects/ заметно быстрее питоновского обхода shutil.rmtree
+_RM_BINARY = shutil.which("rm") if os.name == "posix" else None
 
 
 def normalize_project_id(value: str) -> str:
     raw = (value or "").strip()
-    cleaned = re.sub(r"[^a-zA-Z0-9._-]+", "-", raw)
+    cleaned = _PROJECT_ID_INVALID_RE.sub("-", raw)
     cleaned = cleaned.strip("-_.")
     return cleaned.lower()
 
 
+def _read_optional(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _decode_text(data: Optional[bytes]) -> str:
+    """Decode like Path.read_text(): UTF-8 with universal newlines."""
+    if not data:
+        return ""
+    text = data.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
 def unique_preserve_order(seq: List[str]) -> List[str]:
     seen = set()
     result: List[str] = []
@@ -51,10 +82,11 @@ def unique_preserve_order(seq: List[str]) -> List[str]:
     return result
 
 
+@lru_cache(maxsize=512)
 def build_content_disposition(filename: str) -> str:
     """Return ASCII-safe Content-Disposition with UTF-8 filename* for non-ASCII names."""
     base = filename or "export.txt"
-    ascii_name = re.sub(r"[^A-Za-z0-9._-]+", "_", base).strip("_") or "export.txt"
+    ascii_name = _FILENAME_INVALID_RE.sub("_", base).strip("_") or "export.txt"
     try:
         encoded = quote(base, safe="")
         return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{encoded}'
@@ -62,6 +94,94 @@ def build_content_disposition(filename: str) -> str:
         return f'attachment; filename="{ascii_name}"'
 
 
+def _fast_rmtree(path: Union[str, Path]) -> None:
+    """Remove a directory tree, preferring rm -rf on POSIX; errors are ignored like rmtree(ignore_errors=True)."""
+    if _RM_BINARY:
+        try:
+            result = subprocess.run(
+                [_RM_BINARY, "-rf", "--", str(path)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+            if result.returncode == 0:
+                return
+        except OSError:
+            pass
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _split_request_path(raw: str) -> Tuple[str, str]:
+    """Split a request target into (path, query) without building a urlparse SplitResult."""
+    # Клиенты не отправляют #fragment в строке запроса — достаточно одного partition
+    path, _, query = raw.partition("?")
+    return path, query
+
+
+# Таблицы с колонкой source_id, очищаемые при сбросе аккаунта. messages — первой: строки FTS снимает
+# messages_fts_delete построчно в любом случае, но каскадному триггеру conversations потом уже нечего удалять
+_RESET_TABLES = ("messages", "conversations", "imports")
+
+
+@lru_cache(maxsize=64)
+def _delete_sources_sql(count: int) -> Tuple[str, ...]:
+    """DELETE statements for a batch of `count` source ids; identical strings keep sqlite3's statement cache hot."""
+    placeholders = ",".join("?" * count)
+    return tuple(f"DELETE FROM {table} WHERE source_id IN ({placeholders})" for table in _RESET_TABLES)
+
+
+# Чтение файлов беседы ждет диск (GIL отпущен); потоки создаются лениво при первой отправке задачи
+_FILE_READ_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="archive-read")
+# Удаление деревьев папок (rmtree) идет фоном, чтобы не задерживать HTTP-ответ
+_BACKGROUND_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive-cleanup")
+_TRASH_DIR = ".trash"
+# Беседы крупнее порога отдаются chunked: клиент получает первые байты, не дожидаясь чтения всего файла
+_CHUNKED_JSON_MIN_SIZE = 256 * 1024
+_CHUNK_SIZE = 64 * 1024
+_JSON_EDGE_SIZE = 256
+
+
+def _has_json_object_edges(stream: BinaryIO, size: int) -> bool:
+    """Cheaply check that a file starts with "{" and ends with "}" (ignoring whitespace); rewinds the stream."""
+    head = stream.read(_JSON_EDGE_SIZE).lstrip()
+    stream.seek(max(size - _JSON_EDGE_SIZE, 0))
+    tail = stream.read(_JSON_EDGE_SIZE).rstrip()
+    stream.seek(0)
+    return head[:1] == b"{" and tail[-1:] == b"}"
+# POST-эндпоинты принимают только небольшие JSON-команды; архивы передаются путем, а не телом запроса
+_MAX_BODY_SIZE = 1024 * 1024
+_DELETE_SOURCES_BATCH = 900  # ниже старого лимита SQLite в 999 параметров
+_MAX_IDLE_CONNECTIONS = 8
+# Настройки каждого соединения сервера (journal_mode=WAL хранится в файле БД и включается один раз в __init__).
+# Нагрузка в основном читающая: страницы читаем через mmap, 64 МБ страничного кэша вместо 2 МБ по умолчанию.
+# synchronous=NORMAL в WAL: fsync только на чекпоинтах. При сбое питания могут пропасть последние
+# закоммиченные правки (переименования, переносы), но база остается целостной; index.db и так
+# пересобирается из zip-экспортов, а project_overrides.json пишется отдельно.
+_CONNECTION_PRAGMAS = """
+PRAGMA synchronous=NORMAL;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+PRAGMA temp_store=MEMORY;
+PRAGMA wal_autocheckpoint=1000;
+"""
+_SQL_CACHE_LIMIT = 256  # разных наборов фильтров списка бесед немного; предел на случай перебора project_name
+
+# Порядок колонок SELECT в _handle_conversations
+_CONVERSATION_LIST_KEYS = (
+    "conversation_id",
+    "original_id",
+    "source_id",
+    "project_uid",
+    "project_id",
+    "title",
+    "created_at",
+    "updated_at",
+    "snippet",
+    "folder",
+    "model",
+)
+
+
 class ArchiveServer:
     def __init__(self, root: Path, host: str = "127.0.0.1", port: int = 8000) -> None:
         self.root = root.resolve()
@@ -71,41 +191,224 @@ class ArchiveServer:
         if not self.db_path.exists():
             # Создаем пустую схему, чтобы UI мог стартовать "с нуля"
             _prepare_database(self.db_path, rebuild=True).close()
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        # Сервер многопоточный: у каждого потока обработчика свое соединение из пула простаивающих
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._idle_conns: List[sqlite3.Connection] = []
+        self._conn_generation = 0
+        # Изменяющие POST-запросы (overrides + пересчет projects) выполняются по одному
+        self._write_lock = threading.Lock()
+        # WAL хранится в самом файле БД: переключаем один раз, если база еще не в нем (переподключения его не трогают)
         try:
-            self.conn.execute("PRAGMA journal_mode=WAL;")
+            if str(self.conn.execute("PRAGMA journal_mode").fetchone()[0]).lower() != "wal":
+                self.conn.execute("PRAGMA journal_mode=WAL;")
         except sqlite3.OperationalError:
             pass
         cols = {row[1] for row in self.conn.execute("PRAGMA table_info(conversations)")}
         if "conversation_uid" not in cols:
             raise RuntimeError("index.db uses a legacy schema; re-import the archive with the updated CLI.")
+        _migrate_schema(self.conn)
+        # Статистику для выбора между индексами по updated_at и фильтрам списка бесед собирает импорт;
+        # здесь ANALYZE только для баз, где ее еще нет, чтобы старт не брал блокировку записи каждый раз
+        try:
+            has_stats = self.conn.execute("SELECT 1 FROM sqlite_stat1 WHERE tbl = 'conversations' LIMIT 1").fetchone()
+        except sqlite3.OperationalError:
+            has_stats = None
+        if has_stats is None:
+            self.conn.execute("ANALYZE conversations")
+            self.conn.commit()
         self.static_dir = Path(__file__).resolve().parent / "templates"
+        self._overrides_path = self.root.parent / "project_overrides.json"
+        self._overrides_cache: Optional[Tuple[Tuple[int, int], Dict[str, Any]]] = None
+        self._conv_sql_cache: Dict[Tuple[str, ...], str] = {}
+        # Фоновые импорты из UI: по одному за раз, статус по job_id
+        self._import_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive-import")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._jobs_lock = threading.Lock()
+        self._empty_trash()
+        self._release_connection()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=_STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_CONNECTION_PRAGMAS)
+        # Для пересчета projects одним INSERT…SELECT; в схеме (индексах, триггерах) функция не используется
+        conn.create_function("normalize_project_name", 1, normalize_project_name, deterministic=True)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection of the current thread; taken from the idle pool or opened on first use."""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            if local.generation == self._conn_generation:
+                return conn
+            # База переоткрыта (импорт/сброс) — старое соединение больше не нужно
+            conn.close()
+        with self._pool_lock:
+            generation = self._conn_generation
+            conn = self._idle_conns.pop() if self._idle_conns else None
+        if conn is None:
+            conn = self._connect()
+        local.conn = conn
+        local.generation = generation
+        return conn
+
+    def _release_connection(self) -> None:
+        """Return the current thread's connection to the idle pool once its request is done."""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            return
+        local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._pool_lock:
+            if local.generation == self._conn_generation and len(self._idle_conns) < _MAX_IDLE_CONNECTIONS:
+                self._idle_conns.append(conn)
+                return
+        conn.close()
+
+    def _tuple_cursor(self) -> sqlite3.Cursor:
+        """Cursor yielding plain tuples: cheaper than sqlite3.Row when rows are only unpacked by position."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    def _discard_tree(self, path: Path) -> None:
+        """Move a directory into .trash synchronously and delete it in the background."""
+        trash_root = self.root / _TRASH_DIR
+        try:
+            ensure_dir(trash_root)
+            trashed = trash_root / uuid.uuid4().hex
+            os.rename(path, trashed)
+        except OSError:
+            # Другая ФС или гонка с очисткой корзины — удаляем на месте, как раньше
+            _fast_rmtree(path)
+            return
+        _BACKGROUND_POOL.submit(_fast_rmtree, trashed)
+
+    def _empty_trash(self) -> None:
+        """Delete leftovers of interrupted background removals."""
+        trash_root = self.root / _TRASH_DIR
+        try:
+            entries = list(os.scandir(trash_root))
+        except OSError:
+            return
+        for entry in entries:
+            _BACKGROUND_POOL.submit(_fast_rmtree, entry.path)
 
     def _reload_connection(self) -> None:
+        """Drop every pooled connection; threads reconnect lazily on their next request."""
+        with self._pool_lock:
+            self._conn_generation += 1
+            idle, self._idle_conns = self._idle_conns, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        # Соединение текущего потока закроется при следующем обращении к self.conn
+
+    def _overrides_stamp(self) -> Optional[Tuple[int, int]]:
         try:
-            self.conn.close()
-        except Exception:
-            pass
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+            st = os.stat(self._overrides_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _get_overrides(self) -> Dict[str, Any]:
+        """Return project overrides, re-reading project_overrides.json only when its mtime/size changed."""
+        stamp = self._overrides_stamp()
+        cached = self._overrides_cache
+        if stamp is None or cached is None or cached[0] != stamp:
+            data = load_project_overrides(self.root)
+            # load_project_overrides может создать или перенести файл — берем отметку уже после чтения
+            stamp = self._overrides_stamp()
+            self._overrides_cache = (stamp, data) if stamp is not None else None
+        else:
+            data = cached[1]
+        # Обработчики правят словари на месте перед сохранением — отдаем копии, чтобы не портить кэш
+        return {key: value.copy() for key, value in data.items()}
+
+    def _save_overrides(self, overrides: Dict[str, Any]) -> None:
+        save_project_overrides(self.root, overrides)
+        self._overrides_cache = None
+
+    def _read_body(self, handler: http.server.SimpleHTTPRequestHandler) -> Optional[bytes]:
+        """Read the request body in bounded chunks; reply with an error and return None if it is malformed or too large."""
         try:
-            self.conn.execute("PRAGMA journal_mode=WAL;")
-        except sqlite3.OperationalError:
-            pass
+            length = int(handler.headers.get("Content-Length") or 0)
+        except ValueError:
+            self._send_json(handler, {"error": "Invalid Content-Length"}, status=400)
+            return None
+        if length <= 0:
+            return b""
+        if length > _MAX_BODY_SIZE:
+            # Тело не дочитано — соединение дальше использовать нельзя
+            handler.close_connection = True
+            self._send_json(handler, {"error": "Request body too large"}, status=413)
+            return None
+        chunks: List[bytes] = []
+        remaining = length
+        while remaining > 0:
+            chunk = handler.rfile.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
 
     def _send_json(self, handler: http.server.SimpleHTTPRequestHandler, payload: Any, status: int = 200) -> None:
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send_json_bytes(handler, dumps_json(payload), status)
+
+    def _send_json_bytes(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes, status: int = 200) -> None:
         handler.send_response(status)
         handler.send_header("Content-Type", "application/json; charset=utf-8")
         handler.send_header("Content-Length", str(len(body)))
         handler.end_headers()
         handler.wfile.write(body)
 
+    def _send_json_chunked(
+        self,
+        handler: http.server.SimpleHTTPRequestHandler,
+        prefix: bytes,
+        stream: BinaryIO,
+        suffix: bytes,
+        status: int = 200,
+    ) -> None:
+        """Send prefix + stream contents + suffix as a chunked HTTP/1.1 body without buffering the stream."""
+        # Chunked есть только в HTTP/1.1: поднимаем версию для этого ответа и закрываем соединение после него
+        handler.protocol_version = "HTTP/1.1"
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        write = handler.wfile.write
+
+        def send_chunk(data: bytes) -> None:
+            if data:
+                write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        send_chunk(prefix)
+        while True:
+            block = stream.read(_CHUNK_SIZE)
+            if not block:
+                break
+            send_chunk(block)
+        send_chunk(suffix)
+        write(b"0\r\n\r\n")
+
     def _send_text(
-        self, handler: http.server.SimpleHTTPRequestHandler, payload: str, status: int = 200, filename: str = "export.txt"
+        self,
+        handler: http.server.SimpleHTTPRequestHandler,
+        payload: Union[str, bytes],
+        status: int = 200,
+        filename: str = "export.txt",
     ) -> None:
-        body = payload.encode("utf-8")
+        body = payload.encode("utf-8") if isinstance(payload, str) else payload
         handler.send_response(status)
         handler.send_header("Content-Type", "text/plain; charset=utf-8")
         handler.send_header("Content-Disposition", build_content_disposition(filename))
@@ -123,20 +426,28 @@ class ArchiveServer:
             handler.send_response(404)
             handler.end_headers()
             return
-        data = fs_path.read_bytes()
         mime, _ = mimetypes.guess_type(str(fs_path))
-        handler.send_response(200)
-        handler.send_header("Content-Type", mime or "application/octet-stream")
-        handler.send_header("Content-Length", str(len(data)))
-        handler.end_headers()
-        handler.wfile.write(data)
+        with fs_path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            handler.send_response(200)
+            handler.send_header("Content-Type", mime or "application/octet-stream")
+            handler.send_header("Content-Length", str(size))
+            handler.end_headers()
+            handler.wfile.flush()
+            # socket.sendfile отдает файл ядром (sendfile(2)) и сам откатывается на send() там, где его нет
+            try:
+                handler.request.sendfile(f, 0, size)
+            except (OSError, ValueError, AttributeError):
+                # Не сокет (TLS-обертка, тесты) — дописываем остаток с текущей позиции файла
+                if f.tell() < size:
+                    shutil.copyfileobj(f, handler.wfile, _CHUNK_SIZE)
 
     def _handle_projects(self, handler: http.server.SimpleHTTPRequestHandler) -> None:
         rows = self.conn.execute(
             "SELECT project_uid, source_id, project_id, human_name, conversation_count, first_message_time, last_message_time "
             "FROM projects ORDER BY source_id, human_name"
         ).fetchall()
-        overrides = load_project_overrides(self.root)
+        overrides = self._get_overrides()
         name_overrides = overrides.get("names", {})
         manual_projects = overrides.get("projects") or []
         payload = []
@@ -184,31 +495,30 @@ class ArchiveServer:
         normalized = normalize_project_name(raw_name)
         if not normalized:
             return []
-        rows = self.conn.execute("SELECT project_uid, project_id, human_name FROM projects").fetchall()
-        # 1) match by stored human_name
-        matches = [r["project_uid"] for r in rows if normalize_project_name(r["human_name"]) == normalized]
-        # 2) also respect overrides that might differ from the DB (defensive)
-        overrides = load_project_overrides(self.root)
-        name_overrides = overrides.get("names", {})
+        # Переименования из overrides проверяем в Python (normalize_project_name кэширован), а строки projects —
+        # одним запросом: по индексу human_name_norm плюс project_id из overrides без указания аккаунта
+        name_overrides = self._get_overrides().get("names", {})
+        override_uids: List[str] = []
+        override_ids: List[str] = []
         for key, name in name_overrides.items():
             if normalize_project_name(name) != normalized:
                 continue
-            if ":" in key:
-                matches.append(key)
-            else:
-                # key is project_id without source; map to all matching rows
-                matches.extend([r["project_uid"] for r in rows if r["project_id"] == key])
+            (override_uids if ":" in key else override_ids).append(key)
+        sql = "SELECT project_uid FROM projects WHERE human_name_norm = ?"
+        if override_ids:
+            sql += f" OR project_id IN ({','.join('?' for _ in override_ids)})"
+        matches = [r[0] for r in self.conn.execute(sql, [normalized, *override_ids])]
+        matches.extend(override_uids)
         return unique_preserve_order(matches)
 
     def _handle_models(self, handler: http.server.SimpleHTTPRequestHandler) -> None:
-        rows = self.conn.execute("SELECT DISTINCT model FROM conversations WHERE model IS NOT NULL").fetchall()
-        models = [r["model"] for r in rows if r["model"]]
+        cursor = self._tuple_cursor()
+        models = [r[0] for r in cursor.execute("SELECT DISTINCT model FROM conversations WHERE model IS NOT NULL") if r[0]]
         self._send_json(handler, models)
 
     def _handle_conversations(self, handler: http.server.SimpleHTTPRequestHandler, query: Dict[str, List[str]]) -> None:
         clauses = []
         params: List[Any] = []
-        join_fragments: List[str] = []
         q = (query.get("q") or [""])[0].strip()
         project_id = (query.get("project_id") or [""])[0].strip()
         project_name_raw = (query.get("project_name") or [""])[0]
@@ -219,9 +529,6 @@ class ArchiveServer:
         date_from = (query.get("date_from") or [""])[0].strip()
         date_to = (query.get("date_to") or [""])[0].strip()
 
-        use_fts = bool(q or role)
-        if use_fts:
-            join_fragments.append("JOIN messages_fts f ON c.conversation_uid = f.conversation_uid")
         project_uids_for_name: List[str] = []
         if project_name:
             project_uids_for_name = self._find_project_uids_by_name(project_name_raw)
@@ -255,25 +562,40 @@ class ArchiveServer:
         if date_to:
             clauses.append("c.updated_at <= ?")
             params.append(float(date_to))
-        if role and use_fts:
-            clauses.append("f.role = ?")
-            params.append(role)
         if q:
-            clauses.append("messages_fts MATCH ?")
-            params.append(q)
+            # role в FTS5 — UNINDEXED-колонка, в MATCH ее не отфильтровать: MATCH ведет поиск по индексу,
+            # а роль проверяется уже на найденных строках. Подзапрос вместо JOIN избавляет от DISTINCT.
+            if role:
+                clauses.append(
+                    "c.conversation_uid IN (SELECT conversation_uid FROM messages_fts WHERE messages_fts MATCH ? AND role = ?)"
+                )
+                params.extend([q, role])
+            else:
+                clauses.append("c.conversation_uid IN (SELECT conversation_uid FROM messages_fts WHERE messages_fts MATCH ?)")
+                params.append(q)
+        elif role:
+            # Без текста запроса FTS не нужен: проверяем роль по messages через idx_msg_conv
+            clauses.append("EXISTS (SELECT 1 FROM messages m WHERE m.conversation_uid = c.conversation_uid AND m.role = ?)")
+            params.append(role)
 
-        where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
-        join_sql = " ".join(join_fragments)
-        sql = (
-            "SELECT DISTINCT c.conversation_uid as conversation_id, c.conversation_id as original_id, c.source_id, c.project_uid, c.project_id, "
-            "c.title, c.created_at, c.updated_at, c.snippet, c.folder, c.model "
-            "FROM conversations c "
-            f"{join_sql} "
-            f"{where_sql} "
-            "ORDER BY c.updated_at DESC LIMIT 400"
-        )
-        rows = self.conn.execute(sql, params).fetchall()
-        self._send_json(handler, [dict(r) for r in rows])
+        # Один и тот же набор фильтров дает ту же строку SQL: собираем ее один раз, а sqlite3 держит ее подготовленной
+        signature = tuple(clauses)
+        sql = self._conv_sql_cache.get(signature)
+        if sql is None:
+            where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+            sql = (
+                "SELECT c.conversation_uid as conversation_id, c.conversation_id as original_id, c.source_id, c.project_uid, c.project_id, "
+                "c.title, c.created_at, c.updated_at, c.snippet, c.folder, c.model "
+                "FROM conversations c "
+                f"{where_sql} "
+                "ORDER BY c.updated_at DESC LIMIT 400"
+            )
+            if len(self._conv_sql_cache) >= _SQL_CACHE_LIMIT:
+                self._conv_sql_cache.clear()
+            self._conv_sql_cache[signature] = sql
+        keys = _CONVERSATION_LIST_KEYS
+        rows = self._tuple_cursor().execute(sql, params).fetchall()
+        self._send_json(handler, [dict(zip(keys, r)) for r in rows])
 
     def _handle_conversation(self, handler: http.server.SimpleHTTPRequestHandler, conversation_id: str) -> None:
         row = self.conn.execute(
@@ -307,72 +629,93 @@ class ArchiveServer:
             "project_code": row["project_id"],
             "source_id": row["source_id"],
         }
+        # Независимые чтения с диска выполняем параллельно; conversation.json открываем здесь, чтобы уметь отдать его потоком
+        md_data, html_data, obsidian_data = _FILE_READ_POOL.map(_read_optional, (md_path, html_path, obsidian_path))
+        payload["markdown"] = _decode_text(md_data)
+        payload["html"] = _decode_text(html_data)
+        payload["obsidian"] = _decode_text(obsidian_data)
+        # Представления пишутся только для выбранных при импорте --formats: ссылки отдаем лишь на существующие файлы
+        paths: Dict[str, Any] = {"json": str(json_path)}
+        web_paths = {"json": f"/files/{folder}/conversation.json"}
+        views = (("markdown", md_path, md_data), ("html", html_path, html_data), ("obsidian", obsidian_path, obsidian_data))
+        for key, path, data in views:
+            if data is not None:
+                paths[key] = str(path)
+                web_paths[key] = f"/files/{folder}/{path.name}"
+        paths["web"] = web_paths
+        payload["paths"] = paths
+        # conversation.json уже лежит на диске готовым JSON: вклеиваем байты как есть, без разбора и повторной сериализации
+        prefix = dumps_json(payload)[:-1] + b',"conversation":'
         try:
-            payload["conversation"] = json.loads(json_path.read_text(encoding="utf-8"))
+            json_file = json_path.open("rb")
         except FileNotFoundError:
-            payload["conversation"] = None
-        payload["markdown"] = md_path.read_text(encoding="utf-8") if md_path.exists() else ""
-        payload["html"] = html_path.read_text(encoding="utf-8") if html_path.exists() else ""
-        payload["obsidian"] = obsidian_path.read_text(encoding="utf-8") if obsidian_path.exists() else ""
-        payload["paths"] = {
-            "json": str(json_path),
-            "markdown": str(md_path),
-            "html": str(html_path),
-            "obsidian": str(obsidian_path),
-            "web": {
-                "json": f"/files/{folder}/conversation.json",
-                "markdown": f"/files/{folder}/conversation.md",
-                "html": f"/files/{folder}/conversation.html",
-                "obsidian": f"/files/{folder}/conversation-obsidian.md",
-            },
-        }
-        self._send_json(handler, payload)
+            return self._send_json_bytes(handler, prefix + b"null}")
+        with json_file:
+            size = os.fstat(json_file.fileno()).st_size
+            if size >= _CHUNKED_JSON_MIN_SIZE and handler.request_version == "HTTP/1.1":
+                # Битый файл нельзя вклеивать: клиент получил бы невалидный JSON со статусом 200
+                if not _has_json_object_edges(json_file, size):
+                    return self._send_json(handler, {"error": "Corrupt conversation.json"}, status=500)
+                return self._send_json_chunked(handler, prefix, json_file, b"}")
+            conversation_bytes = json_file.read().strip() or b"null"
+        if conversation_bytes != b"null" and not (conversation_bytes[:1] == b"{" and conversation_bytes[-1:] == b"}"):
+            # Небольшой файл дешево разобрать целиком: отдаем то, что удалось прочитать, или ошибку
+            try:
+                conversation_bytes = dumps_json(loads_json(conversation_bytes))
+            except ValueError:
+                return self._send_json(handler, {"error": "Corrupt conversation.json"}, status=500)
+        self._send_json_bytes(handler, prefix + conversation_bytes + b"}")
+
+    def _recalculate_projects(self, touched: Iterable[str] = (), commit: bool = True) -> None:
+        """Rebuild the projects table from conversations; rewrite _meta.json only for the touched project uids.
 
-    def _recalculate_projects(self) -> None:
-        overrides = load_project_overrides(self.root)
+        With commit=False the caller owns the surrounding transaction.
+        """
+        overrides = self._get_overrides()
         name_overrides = overrides.get("names", {})
+        self.conn.execute("DELETE FROM projects")
+        self.conn.execute(
+            "INSERT INTO projects (project_uid, source_id, project_id, human_name, human_name_norm, conversation_count, first_message_time, last_message_time) "
+            "SELECT source_id || ':' || project_id, source_id, project_id, name, normalize_project_name(name), cnt, first_message_time, last_message_time "
+            "FROM (SELECT source_id, project_id, "
+            "CASE WHEN project_id = 'no_project' THEN 'Без проекта' ELSE 'Project ' || substr(project_id, 1, 8) END AS name, "
+            "COUNT(*) AS cnt, MIN(created_at) AS first_message_time, MAX(updated_at) AS last_message_time "
+            "FROM conversations GROUP BY source_id, project_id)"
+        )
+        # Переименования: сначала по project_id (для всех аккаунтов), затем по project_uid — он приоритетнее
+        by_id = [(name, normalize_project_name(name), key) for key, name in name_overrides.items() if name and ":" not in key]
+        by_uid = [(name, normalize_project_name(name), key) for key, name in name_overrides.items() if name and ":" in key]
+        if by_id:
+            self.conn.executemany("UPDATE projects SET human_name = ?, human_name_norm = ? WHERE project_id = ?", by_id)
+        if by_uid:
+            self.conn.executemany("UPDATE projects SET human_name = ?, human_name_norm = ? WHERE project_uid = ?", by_uid)
+        if commit:
+            self.conn.commit()
+        self._write_project_meta(touched)
+
+    def _write_project_meta(self, touched: Iterable[str]) -> None:
+        """Rewrite _meta.json of the given project uids from the projects table."""
+        touched_uids = list(dict.fromkeys(touched))
+        if not touched_uids:
+            return
+        placeholders = ",".join("?" for _ in touched_uids)
         rows = self.conn.execute(
-            "SELECT source_id, project_id, COUNT(*) as cnt, MIN(created_at) as first_message_time, MAX(updated_at) as last_message_time "
-            "FROM conversations GROUP BY source_id, project_id"
+            "SELECT project_uid, source_id, project_id, human_name, conversation_count, first_message_time, last_message_time "
+            f"FROM projects WHERE project_uid IN ({placeholders})",
+            touched_uids,
         ).fetchall()
-        self.conn.execute("DELETE FROM projects")
-        project_rows = []
         projects_root = self.root / "projects"
         for r in rows:
-            pid = r["project_id"]
-            source_id = r["source_id"]
-            project_uid = make_project_uid(source_id, pid)
-            default_name = "Без проекта" if pid == "no_project" else f"Project {pid[:8]}"
-            human_name = name_overrides.get(project_uid) or name_overrides.get(pid) or default_name
             meta_payload = {
-                "project_id": pid,
-                "project_uid": project_uid,
-                "source_id": source_id,
-                "human_name": human_name,
-                "conversation_count": r["cnt"],
+                "project_id": r["project_id"],
+                "project_uid": r["project_uid"],
+                "source_id": r["source_id"],
+                "human_name": r["human_name"],
+                "conversation_count": r["conversation_count"],
                 "first_message_time": r["first_message_time"],
                 "last_message_time": r["last_message_time"],
             }
-            meta_path = projects_root / source_id / pid / "_meta.json"
-            ensure_dir(meta_path.parent)
-            write_json(meta_path, meta_payload)
-            project_rows.append(
-                (
-                    project_uid,
-                    source_id,
-                    pid,
-                    human_name,
-                    r["cnt"],
-                    r["first_message_time"],
-                    r["last_message_time"],
-                )
-            )
-        if project_rows:
-            self.conn.executemany(
-                "INSERT INTO projects (project_uid, source_id, project_id, human_name, conversation_count, first_message_time, last_message_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                project_rows,
-            )
-        self.conn.commit()
+            write_json(projects_root / r["source_id"] / r["project_id"] / "_meta.json", meta_payload)
 
     def _project_conversation_count(self, source_id: str, project_id: str) -> int:
         try:
@@ -430,11 +773,14 @@ class ArchiveServer:
             row["project_uid"]: row["human_name"]
             for row in self.conn.execute("SELECT project_uid, human_name FROM projects").fetchall()
         }
-        overrides = load_project_overrides(self.root)
+        overrides = self._get_overrides()
         name_overrides = overrides.get("names", {})
 
-        rows = self.conn.execute(
-            "SELECT c.source_id, c.project_id, c.project_uid, c.title, c.conversation_uid, c.created_at, c.updated_at, "
+        # Строки не копим в список и не оборачиваем в sqlite3.Row: идем по курсору кортежами
+        cursor = self._tuple_cursor()
+        cursor.arraysize = 1000
+        cursor.execute(
+            "SELECT c.source_id, c.project_id, c.project_uid, c.title, c.conversation_uid, c.updated_at, "
             "m.role, m.content, m.created_at AS message_created "
             "FROM conversations c "
             "JOIN messages m ON c.conversation_uid = m.conversation_uid "
@@ -442,38 +788,52 @@ class ArchiveServer:
             f"{where_sql} "
             "ORDER BY c.source_id, c.project_uid, c.updated_at, c.conversation_uid, m.created_at",
             params,
-        ).fetchall()
-
-        if not rows:
+        )
+        first_row = cursor.fetchone()
+        if first_row is None:
             return self._send_json(handler, {"error": "No data to export"}, status=404)
 
+        ts_cache: Dict[Any, str] = {}
+
         def fmt_ts(ts: Any) -> str:
+            # У сообщений одного чата метки часто совпадают — форматируем каждую один раз
+            cached = ts_cache.get(ts)
+            if cached is not None:
+                return cached
             try:
-                if ts is None:
-                    return ""
-                return datetime.fromtimestamp(float(ts)).isoformat(sep=" ", timespec="seconds")
+                value = "" if ts is None else datetime.fromtimestamp(float(ts)).isoformat(sep=" ", timespec="seconds")
             except Exception:
-                return ""
+                value = ""
+            ts_cache[ts] = value
+            return value
+
+        # Пишем UTF-8 сразу в буфер: без списка строк, итогового join и повторного encode
+        buf = io.BytesIO()
+        write = buf.write
+
+        def emit(line: str) -> None:
+            if buf.tell():
+                write(b"\n\n")
+            write(line.encode("utf-8"))
 
-        lines: List[str] = []
+        last_line = ""
+        last_line_start = 0
         current_source = None
         current_project = None
         current_conv = None
-        for r in rows:
-            source_id = r["source_id"]
-            pid = r["project_id"]
-            project_uid = r["project_uid"]
-            conv_id = r["conversation_uid"]
+        for source_id, pid, project_uid, title, conv_id, updated_at, role, content, message_created in chain(
+            (first_row,), cursor
+        ):
             if source_id != current_source:
-                if lines:
-                    lines.append("")
-                lines.append(f"### Account: {source_id}")
+                if buf.tell():
+                    emit("")
+                emit(f"### Account: {source_id}")
                 current_source = source_id
                 current_project = None
                 current_conv = None
             if project_uid != current_project:
-                if lines:
-                    lines.append("")
+                if buf.tell():
+                    emit("")
                 project_name = (
                     name_overrides.get(project_uid)
                     or name_overrides.get(pid)
@@ -481,20 +841,30 @@ class ArchiveServer:
                     or pid
                     or "unknown"
                 )
-                lines.append(f"=== Project: {project_name} ({project_uid}) ===")
+                emit(f"=== Project: {project_name} ({project_uid}) ===")
                 current_project = project_uid
                 current_conv = None
             if conv_id != current_conv:
-                title = (r["title"] or "Untitled").replace("\n", " ").strip()
-                upd = fmt_ts(r["updated_at"])
-                lines.append(f"-- Chat: {title} [{conv_id}]{f' | Updated: {upd}' if upd else ''}")
+                title = (title or "Untitled").replace("\n", " ").strip()
+                upd = fmt_ts(updated_at)
+                emit(f"-- Chat: {title} [{conv_id}]{f' | Updated: {upd}' if upd else ''}")
                 current_conv = conv_id
-            role = r["role"] or "unknown"
+            role = role or "unknown"
             role_label = "User" if role == "user" else "Assistant" if role == "assistant" else role
-            content = r["content"] or ""
-            ts = fmt_ts(r["message_created"])
+            content = content or ""
+            if "\r" in content:
+                content = content.replace("\r\n", "\n")
+            ts = fmt_ts(message_created)
             prefix = f"{role_label}{f' @ {ts}' if ts else ''}: "
-            lines.append(prefix + content.replace("\r\n", "\n"))
+            last_line = prefix + content
+            write(b"\n\n")  # заголовок чата уже записан выше, так что буфер здесь непустой
+            last_line_start = buf.tell()
+            write(last_line.encode("utf-8"))
+
+        # Документ всегда заканчивается строкой сообщения: обрезаем хвостовые пробелы только у нее
+        buf.seek(last_line_start)
+        buf.truncate()
+        write(last_line.rstrip().encode("utf-8") + b"\n")
 
         if project_filter:
             filename = f"project-{project_filter}.txt"
@@ -504,12 +874,11 @@ class ArchiveServer:
             filename = f"account-{source_filter}.txt"
         else:
             filename = "all-projects.txt"
-        body = "\n\n".join(lines).strip() + "\n"
-        self._send_text(handler, body, filename=filename)
+        self._send_text(handler, buf.getvalue(), filename=filename)
 
     def _handle_project_create(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes) -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}")
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
@@ -529,7 +898,7 @@ class ArchiveServer:
             self.conn.execute("SELECT 1 FROM projects WHERE project_uid = ?", (project_uid,)).fetchone()
             is not None
         )
-        overrides = load_project_overrides(self.root)
+        overrides = self._get_overrides()
         manual_projects = overrides.get("projects") or []
         manual_set = {str(p).strip() for p in manual_projects if str(p).strip()}
         names = overrides.get("names", {})
@@ -541,8 +910,7 @@ class ArchiveServer:
         manual_set.add(project_uid)
         manual_projects = list(manual_set)
         names[project_uid] = human_name
-        save_project_overrides(
-            self.root,
+        self._save_overrides(
             {"names": names, "moves": moves, "project_moves": project_moves, "projects": manual_projects},
         )
 
@@ -563,7 +931,7 @@ class ArchiveServer:
 
     def _handle_project_rename(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes) -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}")
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
@@ -585,17 +953,21 @@ class ArchiveServer:
         if not row:
             return self._send_json(handler, {"error": "Project not found"}, status=404)
 
-        overrides = load_project_overrides(self.root)
+        # Сначала БД: если она занята, overrides и _meta.json остаются нетронутыми
+        self.conn.execute(
+            "UPDATE projects SET human_name = ?, human_name_norm = ? WHERE project_uid = ?",
+            (human_name, normalize_project_name(human_name), project_uid),
+        )
+        self.conn.commit()
+
+        overrides = self._get_overrides()
         names = overrides.get("names", {})
         moves = overrides.get("moves", {})
         project_moves = overrides.get("project_moves", {})
         projects = overrides.get("projects") or []
         names[project_uid] = human_name
         overrides = {"names": names, "moves": moves, "project_moves": project_moves, "projects": projects}
-        save_project_overrides(self.root, overrides)
-
-        self.conn.execute("UPDATE projects SET human_name = ? WHERE project_uid = ?", (human_name, project_uid))
-        self.conn.commit()
+        self._save_overrides(overrides)
 
         meta_path = self.root / "projects" / source_id / project_id / "_meta.json"
         ensure_dir(meta_path.parent)
@@ -613,7 +985,7 @@ class ArchiveServer:
 
     def _handle_conversation_move(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes) -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}")
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
@@ -656,44 +1028,68 @@ class ArchiveServer:
             dest_rel = Path("projects") / target_source / target_project_id / f"{folder_name}-{conv_uid[:8]}"
             dest_fs = (self.root / dest_rel).resolve()
 
-        ensure_dir(dest_fs.parent)
-        if src_fs.exists():
-            shutil.move(str(src_fs), str(dest_fs))
-
         project_uid = make_project_uid(target_source, target_project_id)
+        # UPDATE берет блокировку записи до переноса папки: занятая база не оставит папку и overrides на полпути
         self.conn.execute(
             "UPDATE conversations SET project_id = ?, project_uid = ?, folder = ? WHERE conversation_uid = ?",
             (target_project_id, project_uid, str(dest_rel), conv_uid),
         )
-
-        overrides = load_project_overrides(self.root)
+        moved = False
+        try:
+            ensure_dir(dest_fs.parent)
+            if src_fs.exists():
+                try:
+                    # В пределах одной ФС это атомарная смена имени, независимо от числа файлов в папке
+                    os.rename(src_fs, dest_fs)
+                except OSError as exc:
+                    if exc.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                        # Папку с таким именем успели создать в целевом проекте — ничего не меняем
+                        self.conn.rollback()
+                        return self._send_json(handler, {"error": "Target folder already exists"}, status=409)
+                    if exc.errno != errno.EXDEV:
+                        raise
+                    shutil.move(str(src_fs), str(dest_fs))
+                moved = True
+            source_emptied = self._project_conversation_count(source_id, source_project_id) == 0
+            self._recalculate_projects(commit=False)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            if moved:
+                try:
+                    os.rename(dest_fs, src_fs)
+                except OSError:
+                    pass
+            raise
+
+        overrides = self._get_overrides()
         names = overrides.get("names", {})
         moves = overrides.get("moves", {})
         project_moves = overrides.get("project_moves", {})
         projects = overrides.get("projects") or []
         moves[conv_uid] = project_uid
-        if self._project_conversation_count(source_id, source_project_id) == 0:
+        if source_emptied:
             project_moves[source_project_uid] = project_uid
             self._remove_project_dir(source_id, source_project_id)
-        save_project_overrides(
-            self.root, {"names": names, "moves": moves, "project_moves": project_moves, "projects": projects}
+        self._save_overrides(
+            {"names": names, "moves": moves, "project_moves": project_moves, "projects": projects}
         )
 
         json_path = dest_fs / "conversation.json"
         if json_path.exists():
             try:
-                convo = json.loads(json_path.read_text(encoding="utf-8"))
+                convo = loads_json(json_path.read_bytes())
                 convo["project_uid"] = project_uid
                 convo["project_id"] = target_project_id
                 convo["source_id"] = target_source
                 convo.setdefault("metadata", {})
                 convo["metadata"]["gizmo_id"] = target_project_id
                 convo["metadata"]["source_id"] = target_source
-                write_json(json_path, convo)
+                write_json(json_path, convo, indent=False)
             except Exception:
                 pass
 
-        self._recalculate_projects()
+        self._write_project_meta((source_project_uid, project_uid))
         self._send_json(
             handler,
             {"status": "ok", "project_id": project_uid, "folder": str(dest_rel)},
@@ -701,7 +1097,7 @@ class ArchiveServer:
 
     def _handle_conversation_delete(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes) -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}")
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
@@ -722,25 +1118,25 @@ class ArchiveServer:
             return self._send_json(handler, {"error": "Conversation not found"}, status=404)
 
         conv_uid = row["conversation_uid"]
-        folder_path = (self.root / row["folder"]).resolve()
-        if folder_path.exists():
-            shutil.rmtree(folder_path, ignore_errors=True)
-
-        self.conn.execute("DELETE FROM messages WHERE conversation_uid = ?", (conv_uid,))
-        self.conn.execute("DELETE FROM messages_fts WHERE conversation_uid = ?", (conv_uid,))
+        # Сначала БД: если она занята, папка беседы и overrides остаются на месте.
+        # Сообщения и строки FTS удаляют триггеры conversations_cascade_delete/messages_fts_delete
         self.conn.execute("DELETE FROM conversations WHERE conversation_uid = ?", (conv_uid,))
         self.conn.commit()
 
-        overrides = load_project_overrides(self.root)
+        folder_path = (self.root / row["folder"]).resolve()
+        if folder_path.exists():
+            self._discard_tree(folder_path)
+
+        overrides = self._get_overrides()
         names = overrides.get("names", {})
         moves = overrides.get("moves", {})
         project_moves = overrides.get("project_moves", {})
         projects = overrides.get("projects") or []
         if conv_uid in moves:
             moves.pop(conv_uid, None)
-            save_project_overrides(self.root, {"names": names, "moves": moves, "project_moves": project_moves, "projects": projects})
+            self._save_overrides({"names": names, "moves": moves, "project_moves": project_moves, "projects": projects})
 
-        self._recalculate_projects()
+        self._recalculate_projects(touched=(row["project_uid"],))
         self._send_json(handler, {"status": "ok"})
 
     def _list_available_exports(self) -> List[Path]:
@@ -766,7 +1162,7 @@ class ArchiveServer:
 
     def _handle_import_run(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes) -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}")
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
@@ -784,58 +1180,130 @@ class ArchiveServer:
         if not candidate.exists():
             return self._send_json(handler, {"error": "archive not found"}, status=404)
 
+        options = ImportOptions(
+            export_path=candidate,
+            output_root=self.root,
+            allow_network_images=False,
+            incremental=incremental,
+            source_id=account,
+            # UI копирует Markdown из conversation.md, поэтому из UI пишем все представления
+            formats=set(OUTPUT_FORMATS),
+            # Сервер продолжает читать базу во время импорта
+            keep_wal=True,
+        )
+        job_id = uuid.uuid4().hex
+        with self._jobs_lock:
+            self._jobs[job_id] = {"job_id": job_id, "status": "running", "archive": archive}
+        # Импорт может идти минутами: выполняем его вне обработчика, сервер продолжает отвечать
+        self._import_pool.submit(self._run_import_job, job_id, options)
+        self._send_json(handler, {"job_id": job_id, "status": "running", "archive": archive}, status=202)
+
+    def _run_import_job(self, job_id: str, options: ImportOptions) -> None:
         try:
-            result = import_archive(
-                ImportOptions(
-                    export_path=candidate,
-                    output_root=self.root,
-                    allow_network_images=False,
-                    incremental=incremental,
-                    source_id=account,
-                )
-            )
-            # Переподключаемся к БД на свежую схему/данные
-            self._reload_connection()
+            result = import_archive(options)
         except Exception as exc:  # pragma: no cover - surface to UI
-            return self._send_json(handler, {"error": str(exc)}, status=500)
-
-        self._send_json(handler, {"status": "ok", "archive": archive, "result": result})
+            update: Dict[str, Any] = {"status": "error", "error": str(exc)}
+        else:
+            update = {"status": "ok", "result": result}
+        # Переподключаемся к БД на свежую схему/данные: потоки обработчиков подхватят новое поколение
+        self._reload_connection()
+        with self._jobs_lock:
+            self._jobs[job_id].update(update)
+
+    def _run_mutation(
+        self,
+        handler: http.server.SimpleHTTPRequestHandler,
+        path: str,
+        route: Callable[[http.server.SimpleHTTPRequestHandler, bytes], None],
+        body: bytes,
+    ) -> None:
+        """Run a mutating POST route; refuse it while a background import holds the database."""
+        # Импорт держит BEGIN IMMEDIATE до конца: правки ждали бы busy timeout и падали на полпути
+        if path != "/api/imports" and self._import_running():
+            return self._send_json(handler, {"error": "Import is still running"}, status=409)
+        try:
+            route(handler, body)
+        except sqlite3.OperationalError as exc:
+            # Базу держит другой процесс (например, импорт из CLI): отвечаем ошибкой, а не обрывом соединения
+            try:
+                self.conn.rollback()
+            except sqlite3.Error:
+                pass
+            self._send_json(handler, {"error": f"Database is busy: {exc}"}, status=503)
+
+    def _import_running(self) -> bool:
+        with self._jobs_lock:
+            return any(job["status"] == "running" for job in self._jobs.values())
+
+    def _handle_import_status(self, handler: http.server.SimpleHTTPRequestHandler, query: Dict[str, List[str]]) -> None:
+        job_id = (query.get("job_id") or [""])[0].strip()
+        with self._jobs_lock:
+            job = dict(self._jobs[job_id]) if job_id in self._jobs else None
+        if job is None:
+            return self._send_json(handler, {"error": "Job not found"}, status=404)
+        self._send_json(handler, job)
+
+    def _delete_sources(self, source_ids: List[str]) -> None:
+        """Delete all rows of the given accounts and rebuild projects in a single transaction."""
+        # Удаление и пересчет projects — одна транзакция и один fsync
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for batch in batched(source_ids, _DELETE_SOURCES_BATCH):
+                for sql in _delete_sources_sql(len(batch)):
+                    self.conn.execute(sql, batch)
+            # projects этих аккаунтов исчезнут при пересчете: он перестраивает таблицу целиком
+            self._recalculate_projects(commit=False)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        # Схема не менялась — переподключение не нужно; статистику планировщика освежаем дешево
+        try:
+            self.conn.execute("PRAGMA optimize")
+        except sqlite3.OperationalError:
+            pass
 
     def _handle_reset(self, handler: http.server.SimpleHTTPRequestHandler, body: bytes = b"") -> None:
         try:
-            payload = json.loads(body.decode("utf-8") or "{}") if body else {}
+            payload = loads_json(body) if body else {}
         except json.JSONDecodeError:
             return self._send_json(handler, {"error": "Invalid JSON"}, status=400)
 
         source_raw = str(payload.get("source_id") or payload.get("account") or "").strip()
-        source_id = normalize_source_id(source_raw) if source_raw else ""
+        source_ids = [normalize_source_id(source_raw)] if source_raw else []
+        extra_ids = payload.get("source_ids")
+        if isinstance(extra_ids, list):
+            # Пакетный режим: несколько аккаунтов за один запрос
+            source_ids.extend(normalize_source_id(str(s).strip()) for s in extra_ids if str(s or "").strip())
+        source_ids = list(dict.fromkeys(source_ids))
 
-        if source_id:
-            # Удаляем данные конкретного аккаунта, оставляя остальные нетронутыми
-            projects_root = self.root / "projects"
-            target_dir = projects_root / source_id
-            try:
-                if target_dir.exists():
-                    shutil.rmtree(target_dir, ignore_errors=True)
-            except Exception:
-                pass
+        if source_ids:
+            # Удаляем данные конкретных аккаунтов, оставляя остальные нетронутыми; папки — только после БД
+            self._delete_sources(source_ids)
 
-            self.conn.execute("DELETE FROM messages WHERE source_id = ?", (source_id,))
-            self.conn.execute("DELETE FROM messages_fts WHERE source_id = ?", (source_id,))
-            self.conn.execute("DELETE FROM conversations WHERE source_id = ?", (source_id,))
-            self.conn.execute("DELETE FROM projects WHERE source_id = ?", (source_id,))
-            self.conn.execute("DELETE FROM imports WHERE source_id = ?", (source_id,))
-            self.conn.commit()
-
-            self._recalculate_projects()
+            projects_root = self.root / "projects"
+            for sid in source_ids:
+                target_dir = projects_root / sid
+                try:
+                    if target_dir.exists():
+                        self._discard_tree(target_dir)
+                except Exception:
+                    pass
 
             try:
-                if projects_root.exists() and not any(projects_root.iterdir()):
-                    shutil.rmtree(projects_root, ignore_errors=True)
-            except Exception:
+                # Один opendir без предварительного stat и без Path на каждую запись
+                with os.scandir(projects_root) as entries:
+                    empty = next(entries, None) is None
+                if empty:
+                    os.rmdir(projects_root)
+            except OSError:
                 pass
 
-            return self._send_json(handler, {"status": "ok", "source_id": source_id})
+            if len(source_ids) == 1:
+                return self._send_json(handler, {"status": "ok", "source_id": source_ids[0]})
+            return self._send_json(handler, {"status": "ok", "source_ids": source_ids})
 
         # Удаляем сгенерированные артефакты архива, не трогая .zip экспорты
         targets = [
@@ -847,83 +1315,93 @@ class ArchiveServer:
         for t in targets:
             try:
                 if t.is_dir():
-                    shutil.rmtree(t, ignore_errors=True)
+                    self._discard_tree(t)
                 elif t.exists():
                     t.unlink()
             except Exception:
                 continue
+        # projects/ уже в очереди на фоновое удаление через _discard_tree; остатки прерванных удалений чистит старт сервера
         _prepare_database(self.db_path, rebuild=True).close()
         self._reload_connection()
         self._send_json(handler, {"status": "ok"})
 
     def _make_handler(self):
         server = self
+        # Все, что не меняется между запросами, считаем один раз: в обработчике остаются быстрые обращения к замыканию
+        static_dir_str = str(server.static_dir)
+        read_body = server._read_body
+        release_connection = server._release_connection
+        write_lock = server._write_lock
+        ping_body = dumps_json({"status": "ok"})
+        # Точные пути — поиск в словаре; префиксные — короткий перебор get_prefix_routes
+        get_routes = {
+            "/api/projects": lambda h, query: server._handle_projects(h),
+            "/api/models": lambda h, query: server._handle_models(h),
+            "/api/conversations": lambda h, query: server._handle_conversations(h, parse_qs(query)),
+            "/api/export/txt": lambda h, query: server._handle_export_txt(h, parse_qs(query)),
+            "/api/imports": lambda h, query: server._handle_imports_list(h),
+            "/api/imports/status": lambda h, query: server._handle_import_status(h, parse_qs(query)),
+            "/api/reset": lambda h, query: server._send_json(h, {"error": "POST required"}, status=405),
+            "/api/ping": lambda h, query: server._send_json_bytes(h, ping_body),
+        }
+        get_prefix_routes = (
+            ("/api/conversation/", lambda h, rest: server._handle_conversation(h, rest.rsplit("/", 1)[-1])),
+            ("/files/", lambda h, rest: server._serve_file(h, unquote(rest))),
+        )
+        post_routes = {
+            "/api/project/create": server._handle_project_create,
+            "/api/project/rename": server._handle_project_rename,
+            "/api/conversation/move": server._handle_conversation_move,
+            "/api/conversation/delete": server._handle_conversation_delete,
+            "/api/imports": server._handle_import_run,
+            "/api/reset": server._handle_reset,
+        }
 
         class Handler(http.server.SimpleHTTPRequestHandler):
             def __init__(self, *args, **kwargs):
-                super().__init__(*args, directory=str(server.static_dir), **kwargs)
+                super().__init__(*args, directory=static_dir_str, **kwargs)
 
             def log_message(self, format: str, *args) -> None:  # noqa: A003
                 # Keep CLI output quiet
                 return
 
             def do_GET(self) -> None:  # noqa: N802
-                parsed = urlparse(self.path)
-                if parsed.path == "/api/projects":
-                    return server._handle_projects(self)
-                if parsed.path == "/api/models":
-                    return server._handle_models(self)
-                if parsed.path == "/api/conversations":
-                    return server._handle_conversations(self, parse_qs(parsed.query))
-                if parsed.path.startswith("/api/conversation/"):
-                    conversation_id = parsed.path.rsplit("/", 1)[-1]
-                    return server._handle_conversation(self, conversation_id)
-                if parsed.path == "/api/export/txt":
-                    return server._handle_export_txt(self, parse_qs(parsed.query))
-                if parsed.path == "/api/imports":
-                    return server._handle_imports_list(self)
-                if parsed.path == "/api/reset":
-                    return server._send_json(self, {"error": "POST required"}, status=405)
-                if parsed.path.startswith("/files/"):
-                    rel_path = unquote(parsed.path[len("/files/") :])
-                    return server._serve_file(self, rel_path)
-                if parsed.path == "/api/ping":
-                    return server._send_json(self, {"status": "ok"})
+                path, query = _split_request_path(self.path)
+                try:
+                    route = get_routes.get(path)
+                    if route is not None:
+                        return route(self, query)
+                    for prefix, prefix_route in get_prefix_routes:
+                        if path.startswith(prefix):
+                            return prefix_route(self, path[len(prefix) :])
+                except sqlite3.Error as exc:
+                    # Ошибка базы (занята другим процессом, пересоздается) — ответ 503, а не оборванное соединение
+                    return server._send_json(self, {"error": f"Database is unavailable: {exc}"}, status=503)
                 return super().do_GET()
 
             def do_POST(self) -> None:  # noqa: N802
-                parsed = urlparse(self.path)
-                if parsed.path == "/api/project/create":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_project_create(self, body)
-                if parsed.path == "/api/project/rename":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_project_rename(self, body)
-                if parsed.path == "/api/conversation/move":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_conversation_move(self, body)
-                if parsed.path == "/api/conversation/delete":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_conversation_delete(self, body)
-                if parsed.path == "/api/imports":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_import_run(self, body)
-                if parsed.path == "/api/reset":
-                    length = int(self.headers.get("Content-Length") or 0)
-                    body = self.rfile.read(length) if length > 0 else b""
-                    return server._handle_reset(self, body)
-                self.send_response(404)
-                self.end_headers()
+                path = _split_request_path(self.path)[0]
+                route = post_routes.get(path)
+                if route is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = read_body(self)
+                if body is not None:
+                    with write_lock:
+                        server._run_mutation(self, path, route, body)
+
+            def finish(self) -> None:
+                try:
+                    super().finish()
+                finally:
+                    release_connection()
 
         return Handler
 
     def serve(self) -> None:
         handler_cls = self._make_handler()
-        with socketserver.TCPServer((self.host, self.port), handler_cls) as httpd:
+        # Потоки на запрос: долгий экспорт или чтение большой беседы не блокируют остальные запросы UI
+        with http.server.ThreadingHTTPServer((self.host, self.port), handler_cls) as httpd:
             print(f"Serving archive from {self.root} on http://{self.host}:{self.port}")
             httpd.serve_forever()
@@ -651,6 +651,8 @@ function renderConversationView(conversation) {
       console.error("Clipboard copy failed", e);
     }
   };
+  // Markdown есть только если архив импортирован с md (--formats или импорт из UI)
+  ui.copyMd.disabled = !conversation.markdown;
   ui.copyMd.onclick = async () => {
     const md = conversation.markdown;
     if (!md) return;
@@ -885,6 +887,19 @@ async function moveCurrentConversation() {
   hideMoveModal();
 }
 
+async function waitForImportJob(jobId) {
+  // Импорт идет на сервере в фоне: опрашиваем статус, пока задача не завершится
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    const res = await fetch(`/api/imports/status?job_id=${encodeURIComponent(jobId)}`);
+    const job = await res.json().catch(() => ({}));
+    if (!res.ok) throw new Error(job.error || "Не удалось получить статус импорта");
+    if (job.status === "running") continue;
+    if (job.status === "error") throw new Error(job.error || "Импорт не удался");
+    return job;
+  }
+}
+
 async function runImport() {
   const archivePath = ui.importFile.value;
   const account = ui.importAccount.value.trim() || "default";
@@ -904,6 +919,10 @@ async function runImport() {
       const err = await res.json().catch(() => ({}));
       throw new Error(err.error || "Импорт не удался");
     }
+    const job = await res.json();
+    if (job.job_id) {
+      await waitForImportJob(job.job_id);
+    }
     await loadProjects();
     await loadConversations();
     hideImportModal();
@@ -1,27 +1,52 @@
 import json
+import os
 import re
 import time
+import unicodedata
 import uuid
-from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+try:  # orjson необязателен: если установлен, (де)сериализация JSON заметно быстрее
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
 
-INVALID_CHARS = r'[<>:"/\\\\|?*]'
+INVALID_CHARS = r'[<>:"/\\|?*]'
 DEFAULT_SOURCE_ID = "default"
+_INVALID_CHARS_RE = re.compile(INVALID_CHARS)
+_WHITESPACE_RE = re.compile(r"\s+")
+_SOURCE_ID_INVALID_RE = re.compile(r"[^a-zA-Z0-9._-]+")
 
 
+@lru_cache(maxsize=4096)
 def safe_name(name: str, max_length: int = 80) -> str:
     """Convert an arbitrary title into a safe folder name."""
     if not name:
         name = "Untitled"
-    cleaned = re.sub(INVALID_CHARS, "_", name).strip()
-    cleaned = re.sub(r"\\s+", " ", cleaned)
+    cleaned = _WHITESPACE_RE.sub(" ", _INVALID_CHARS_RE.sub("_", name)).strip()
     if len(cleaned) > max_length:
         cleaned = cleaned[: max_length - 3].rstrip() + "..."
     return cleaned or "Untitled"
 
 
+@lru_cache(maxsize=4096)
+def normalize_project_name(value: str) -> str:
+    """Case- and whitespace-insensitive form of a project name used for lookups (projects.human_name_norm)."""
+    raw = (value or "").strip()
+    if raw.isascii():
+        # NFKC для ASCII — тождество; split/join схлопывает пробелы так же, как _WHITESPACE_RE + strip
+        return " ".join(raw.split()).lower()
+    try:
+        normalized = unicodedata.normalize("NFKC", raw)
+    except Exception:
+        normalized = raw
+    normalized = _WHITESPACE_RE.sub(" ", normalized)
+    return normalized.strip().lower()
+
+
 def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
@@ -29,15 +54,16 @@ def ensure_dir(path: Path) -> None:
 def ts_to_date_str(ts: Optional[float]) -> str:
     if not ts:
         return "1970-01-01"
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    return dt.strftime("%Y-%m-%d")
+    tm = time.gmtime(ts)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d}"
 
 
 def ts_to_human(ts: Optional[float]) -> str:
     if not ts:
         return ""
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    return dt.strftime("%Y-%m-%d %H:%M UTC")
+    # gmtime + f-строка: без tzinfo и strftime, формат тот же
+    tm = time.gmtime(ts)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d} UTC"
 
 
 def generate_conversation_id(raw_id: Optional[str]) -> str:
@@ -45,14 +71,51 @@ def generate_conversation_id(raw_id: Optional[str]) -> str:
 
 
 def read_json(path: Path) -> Dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return loads_json(path.read_bytes())
+
+
+def loads_json(data: bytes) -> Any:
+    """Parse UTF-8 JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
+def dumps_json(payload: Any) -> bytes:
+    """Serialize payload to compact UTF-8 JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
 
-def write_json(path: Path, payload: Dict[str, Any]) -> None:
+
+def write_json(path: Path, payload: Dict[str, Any], indent: bool = True, atomic: bool = False) -> None:
+    """Write payload as UTF-8 JSON; indent=False gives compact output for machine-read files.
+
+    With atomic=True the file is written next to the target and moved over it with os.replace,
+    so readers never see a truncated document.
+    """
     ensure_dir(path.parent)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        data = orjson.dumps(payload, option=option)
+    elif indent:
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    else:
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if not atomic:
+        path.write_bytes(data)
+        return
+    # Уникальное имя: сервер пишет из нескольких потоков, а имя .tmp рядом с целью не мешает чтению
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
 
 
 def flatten(iterable: Iterable[Iterable[Any]]) -> Iterable[Any]:
@@ -60,17 +123,28 @@ def flatten(iterable: Iterable[Iterable[Any]]) -> Iterable[Any]:
         yield from item
 
 
+def batched(items: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    """Yield consecutive lists of at most `size` items."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 def now_ts() -> float:
     return time.time()
 
 
+@lru_cache(maxsize=4096)
 def normalize_source_id(raw: Optional[str]) -> str:
     """Sanitize source/account id for safe use in paths and keys."""
     value = (raw or DEFAULT_SOURCE_ID).strip()
     if not value:
         value = DEFAULT_SOURCE_ID
     # Allow only alnum, dot, dash, underscore; replace others with dash
-    value = re.sub(r"[^a-zA-Z0-9._-]+", "-", value)
+    value = _SOURCE_ID_INVALID_RE.sub("-", value)
     value = value.strip("-_.")
     value = value.lower() or DEFAULT_SOURCE_ID
     return value
@@ -80,6 +154,7 @@ def make_project_uid(source_id: str, project_id: str) -> str:
     return f"{source_id}:{project_id}"
 
 
+@lru_cache(maxsize=4096)
 def split_project_uid(uid: str) -> Tuple[str, str]:
     if ":" in uid:
         left, right = uid.split(":", 1)
@@ -91,6 +166,7 @@ def make_conversation_uid(source_id: str, conversation_id: str) -> str:
     return f"{source_id}:{conversation_id}"
 
 
+@lru_cache(maxsize=4096)
 def split_conversation_uid(uid: str) -> Tuple[str, str]:
     if ":" in uid:
         left, right = uid.split(":", 1)
@@ -98,39 +174,42 @@ def split_conversation_uid(uid: str) -> Tuple[str, str]:
     return DEFAULT_SOURCE_ID, uid
 
 
+def _clean_str_map(value: Any) -> Dict[str, str]:
+    """Keep non-empty stripped string values of a mapping; anything that is not a dict yields {}."""
+    if not isinstance(value, dict):
+        return {}
+    return {str(key): text for key, item in value.items() if item is not None and (text := str(item).strip())}
+
+
 def load_project_overrides(root: Path) -> Dict[str, Any]:
     """Read user-defined overrides (names, moves, project_moves, projects) from project_overrides.json."""
     primary = root.parent / "project_overrides.json"
     fallback = root / "project_overrides.json"
-    path = primary if primary.exists() else fallback
 
     def parse(path: Path) -> Dict[str, Any]:
         try:
-            return json.loads(path.read_text(encoding="utf-8"))
+            return loads_json(path.read_bytes())
         except Exception:
             return {}
 
-    # Migrate old location -> new location
-    if not primary.exists() and fallback.exists():
+    # Каждый exists() — это stat: проверяем оба пути не более одного раза
+    if primary.exists():
+        raw = parse(primary)
+    elif fallback.exists():
+        # Migrate old location -> new location
         data = parse(fallback)
+        raw = data if isinstance(data, dict) else {"names": {}, "moves": {}, "project_moves": {}, "projects": []}
         try:
             ensure_dir(primary.parent)
-            write_json(
-                primary,
-                data if isinstance(data, dict) else {"names": {}, "moves": {}, "project_moves": {}, "projects": []},
-            )
+            write_json(primary, raw, atomic=True)
             fallback.unlink()
         except Exception:
             pass
-        path = primary
-
-    if path.exists():
-        raw = parse(path)
     else:
         raw = {}
         try:
             ensure_dir(primary.parent)
-            write_json(primary, {"names": {}, "moves": {}, "project_moves": {}, "projects": []})
+            write_json(primary, {"names": {}, "moves": {}, "project_moves": {}, "projects": []}, atomic=True)
         except Exception:
             pass
 
@@ -138,44 +217,25 @@ def load_project_overrides(root: Path) -> Dict[str, Any]:
     moves: Dict[str, str] = {}
     project_moves: Dict[str, str] = {}
     projects: List[str] = []
+    seen_projects = set()
 
     # Structured format: {"names": {...}, "moves": {...}, "project_moves": {...}, "projects": [...]}
     if isinstance(raw, dict) and ("names" in raw or "moves" in raw or "project_moves" in raw or "projects" in raw):
-        for key, value in (raw.get("names") or {}).items():
-            if value is None:
-                continue
-            name = str(value).strip()
-            if name:
-                names[str(key)] = name
-        for key, value in (raw.get("moves") or {}).items():
-            if value is None:
-                continue
-            target = str(value).strip()
-            if target:
-                moves[str(key)] = target
-        for key, value in (raw.get("project_moves") or {}).items():
-            if value is None:
-                continue
-            target = str(value).strip()
-            if target:
-                project_moves[str(key)] = target
+        names = _clean_str_map(raw.get("names"))
+        moves = _clean_str_map(raw.get("moves"))
+        project_moves = _clean_str_map(raw.get("project_moves"))
         for value in (raw.get("projects") or []):
             try:
                 item = str(value).strip()
             except Exception:
                 continue
-            if item:
+            if item and item not in seen_projects:
+                seen_projects.add(item)
                 projects.append(item)
     # Legacy flat dict: treat as names only
     elif isinstance(raw, dict):
-        for key, value in raw.items():
-            if value is None:
-                continue
-            name = str(value).strip()
-            if name:
-                names[str(key)] = name
+        names = _clean_str_map(raw)
 
-    projects = list(dict.fromkeys(projects))
     return {"names": names, "moves": moves, "project_moves": project_moves, "projects": projects}
 
 
@@ -186,12 +246,19 @@ def save_project_overrides(root: Path, overrides: Dict[str, Any]) -> None:
     project_moves = overrides.get("project_moves") or {}
     projects = overrides.get("projects") or []
     normalized_projects = []
+    seen = set()
     for p in projects:
         try:
             val = str(p).strip()
         except Exception:
             continue
-        if val:
+        if val and val not in seen:
+            seen.add(val)
             normalized_projects.append(val)
     path = root.parent / "project_overrides.json"
-    write_json(path, {"names": names, "moves": moves, "project_moves": project_moves, "projects": normalized_projects})
+    # Обрыв записи не должен обнулить все переименования/переносы: пишем через временный файл
+    write_json(
+        path,
+        {"names": names, "moves": moves, "project_moves": project_moves, "projects": normalized_projects},
+        atomic=True,
+    )